@@ -1,4 +1,5 @@
 import time
+from http import HTTPStatus
 import subprocess
 import requests
 from django.db import connections
@@ -37,6 +38,9 @@ class Command(BaseCommand):
 
         request_body = """
         {
+            "aliases": {
+                "%s": {}
+            },
             "settings": {
                 "refresh_interval": "1s",
                 "analysis": {
@@ -145,15 +149,19 @@ class Command(BaseCommand):
             }
         """
         time.sleep(10)
-        requests.put(
-            url='http://elasticsearch:9200/movies',
-            headers={
-                'Content-Type': 'application/json',
-            },
-            data=request_body,
-        )
+        if requests.head(url='http://elasticsearch:9200/movies').status_code == HTTPStatus.NOT_FOUND:
+            requests.put(
+                url='http://elasticsearch:9200/movies_v1',
+                headers={
+                    'Content-Type': 'application/json',
+                },
+                data=request_body % 'movies',
+            )
         request_body = """
         {
+            "aliases": {
+                "%s": {}
+            },
             "settings": {
                 "refresh_interval": "1s",
                 "analysis": {
@@ -188,8 +196,7 @@ class Command(BaseCommand):
                         "english_stemmer",
                         "english_possessive_stemmer",
                         "russian_stop",
-                        "russian_stemmer",
-                        "keyword_lowercase"
+                        "russian_stemmer"
                     ]
                     }
                 }
@@ -204,9 +211,11 @@ class Command(BaseCommand):
                 "genre": {
                     "type": "text",
                     "analyzer": "ru_en",
-                    "raw": {
+                    "fields": {
+                    "keyword": {
                         "type":  "keyword"
                     }
+                    }
                 },
                 "description": {
                     "type": "text",
@@ -217,15 +226,19 @@ class Command(BaseCommand):
         }
         """
         time.sleep(3)
-        requests.put(
-            url='http://elasticsearch:9200/genres',
-            headers={
-                'Content-Type': 'application/json',
-            },
-            data=request_body,
-        )
+        if requests.head(url='http://elasticsearch:9200/genres').status_code == HTTPStatus.NOT_FOUND:
+            requests.put(
+                url='http://elasticsearch:9200/genres_v1',
+                headers={
+                    'Content-Type': 'application/json',
+                },
+                data=request_body % 'genres',
+            )
         request_body = """
         {
+            "aliases": {
+                "%s": {}
+            },
             "settings": {
                 "refresh_interval": "1s",
                 "analysis": {
@@ -260,8 +273,7 @@ class Command(BaseCommand):
                         "english_stemmer",
                         "english_possessive_stemmer",
                         "russian_stop",
-                        "russian_stemmer",
-                        "keyword_lowercase"
+                        "russian_stemmer"
                     ]
                     }
                 }
@@ -276,8 +288,10 @@ class Command(BaseCommand):
                     "name": {
                         "type": "text",
                         "analyzer": "ru_en",
-                        "raw": {
-                            "type":  "keyword"
+                        "fields": {
+                            "keyword": {
+                                "type":  "keyword"
+                            }
                         }
                     }
                 }
@@ -285,13 +299,14 @@ class Command(BaseCommand):
         }
         """
         time.sleep(3)
-        requests.put(
-            url='http://elasticsearch:9200/persons',
-            headers={
-                'Content-Type': 'application/json',
-            },
-            data=request_body,
-        )
+        if requests.head(url='http://elasticsearch:9200/persons').status_code == HTTPStatus.NOT_FOUND:
+            requests.put(
+                url='http://elasticsearch:9200/persons_v1',
+                headers={
+                    'Content-Type': 'application/json',
+                },
+                data=request_body % 'persons',
+            )
 
         time.sleep(1)
         p = subprocess.Popen(['python', 'sqlite_to_postgres/load_data.py'])
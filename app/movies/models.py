@@ -27,6 +27,9 @@ class Genre(UUIDMixin, TimeStampedMixin):
         db_table = 'content"."genre'
         verbose_name = _('Genre')
         verbose_name_plural = _('Genres')
+        indexes = [
+            models.Index(fields=['modified', 'id']),
+        ]
 
     def __str__(self):
         return self.name
@@ -51,6 +54,9 @@ class Person(UUIDMixin, TimeStampedMixin):
         db_table = 'content"."person'
         verbose_name = _('Person')
         verbose_name_plural = _('Persons')
+        indexes = [
+            models.Index(fields=['modified', 'id']),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -98,6 +104,7 @@ class Filmwork(UUIDMixin, TimeStampedMixin):
         verbose_name_plural = _('Film_works')
         indexes = [
             models.Index(fields=['creation_date']),
+            models.Index(fields=['modified', 'id']),
         ]
 
     def __str__(self):
@@ -0,0 +1,228 @@
+"""
+Нагрузочный бенчмарк API: синтетический каталог в заменах Redis и Elasticsearch (benchmarks/fakes.py),
+поток запросов ко всем маршрутам api/v1 с распределением Ципфа по id, страницам и поисковым словам,
+результат - JSON с пропускной способностью, перцентилями задержки по маршрутам и долей попаданий в кэш.
+
+Запуск из каталога fastapi:
+    PYTHONPATH=src python benchmarks/api_load.py --films 20000 --requests 20000 --concurrency 64 > result.json
+
+Приложение вызывается напрямую через ASGI, без сети; задержки Redis и Elasticsearch задаются
+--redis-latency-ms и --es-latency-ms. Настройки кэша берутся из окружения (CACHE_EXPIRE_IN_SECONDS и т.д.)
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from bisect import bisect
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlencode
+
+from fakes import WORDS, FakeElasticsearch, FakeRedis, generate_catalog
+
+Request = Tuple[str, str, str, Dict[str, str], Optional[bytes]]
+
+
+class Zipf:
+    """Выбор элемента последовательности с вероятностью, обратной рангу в степени s"""
+
+    def __init__(self, items: Sequence, s: float):
+        self.items = items
+        self.cum_weights = list(itertools.accumulate(1 / rank ** s for rank in range(1, len(items) + 1)))
+
+    def __call__(self):
+        return self.items[bisect(self.cum_weights, random.random() * self.cum_weights[-1])]
+
+
+def workload(
+    catalog: Dict[str, List[dict]], s: float, page_size: int, max_pages: int
+) -> List[Tuple[int, Callable[[], Request]]]:
+    """Маршруты с весами и генераторами запросов (маршрут, метод, путь, параметры, тело)"""
+    films, persons, genres = (
+        Zipf([doc['id'] for doc in catalog[index]], s) for index in ('movies', 'persons', 'genres')
+    )
+    pages = Zipf(list(range(1, max_pages + 1)), s)
+    words = Zipf(WORDS, s)
+    genre_names = Zipf([doc['genre'] for doc in catalog['genres']], s)
+
+    def page_params() -> Dict[str, str]:
+        return {'page[number]': str(pages()), 'page[size]': str(page_size), 'sort': random.choice(['true', 'false'])}
+
+    def genre_params() -> Dict[str, str]:
+        return {**page_params(), 'genre': genre_names()}
+
+    def mget(ids: Zipf) -> bytes:
+        return json.dumps({'ids': [ids() for _ in range(page_size)]}).encode()
+
+    return [
+        (30, lambda: ('films/{id}', 'GET', f'/api/v1/films/{films()}', {}, None)),
+        (5, lambda: ('films/_mget', 'POST', '/api/v1/films/_mget', {}, mget(films))),
+        (15, lambda: ('films/movies', 'GET', '/api/v1/films/movies/', page_params(), None)),
+        (5, lambda: ('films/movies?genre', 'GET', '/api/v1/films/movies/', genre_params(), None)),
+        (10, lambda: ('films/search', 'GET', '/api/v1/films/search', {'query': words()}, None)),
+        (10, lambda: ('persons/{id}', 'GET', f'/api/v1/persons/{persons()}', {}, None)),
+        (5, lambda: ('persons/{id}/films', 'GET', f'/api/v1/persons/{persons()}/films', {}, None)),
+        (3, lambda: ('persons/persons', 'GET', '/api/v1/persons/persons/', page_params(), None)),
+        (3, lambda: ('persons/search', 'GET', '/api/v1/persons/search', {'query': words()}, None)),
+        (2, lambda: ('persons/_mget', 'POST', '/api/v1/persons/_mget', {}, mget(persons))),
+        (6, lambda: ('genres/{id}', 'GET', f'/api/v1/genres/{genres()}', {}, None)),
+        (3, lambda: ('genres/genres', 'GET', '/api/v1/genres/genres/', page_params(), None)),
+        (2, lambda: ('genres/search', 'GET', '/api/v1/genres/search', {'query': words()}, None)),
+        (1, lambda: ('genres/_mget', 'POST', '/api/v1/genres/_mget', {}, mget(genres))),
+    ]
+
+
+async def asgi_call(app, method: str, path: str, params: Dict[str, str], body: Optional[bytes]) -> int:
+    """Запрос к ASGI-приложению в том же процессе, возвращает статус ответа"""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': urlencode(params).encode(),
+        'headers': [(b'host', b'benchmark'), (b'content-type', b'application/json')],
+        'client': ('127.0.0.1', 0),
+        'server': ('benchmark', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body or b'', 'more_body': False}]
+    done = asyncio.Event()
+    status = 0
+
+    async def receive() -> dict:
+        if messages:
+            return messages.pop()
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message: dict) -> None:
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            done.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+
+    def at(q: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+
+    return {'p50_ms': at(0.5), 'p90_ms': at(0.9), 'p99_ms': at(0.99), 'max_ms': round(latencies[-1] * 1000, 3)}
+
+
+def cache_stats() -> Dict[str, dict]:
+    """Попадания и промахи по слоям кэша и семействам ключей из счетчика core.metrics"""
+    from core.metrics import CACHE_REQUESTS
+
+    counts = defaultdict(Counter)
+    for metric in CACHE_REQUESTS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith('_total'):
+                labels = sample.labels
+                counts[f"{labels['layer']}:{labels['family']}"][labels['result']] += sample.value
+    return {
+        name: {
+            'hits': int(value['hit']),
+            'misses': int(value['miss']),
+            'hit_ratio': round(value['hit'] / ((value['hit'] + value['miss']) or 1), 4),
+        }
+        for name, value in sorted(counts.items())
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from db import elastic, redis
+    from main import app
+
+    catalog = generate_catalog(args.films, args.persons, args.genres, args.seed)
+    redis.redis = FakeRedis(args.redis_latency_ms / 1000)
+    elastic.es = FakeElasticsearch(catalog, args.es_latency_ms / 1000)
+
+    random.seed(args.seed)
+    routes = workload(catalog, args.zipf, args.page_size, args.max_pages)
+    weights = list(itertools.accumulate(weight for weight, _ in routes))
+    requests = [routes[bisect(weights, random.random() * weights[-1])][1]() for _ in range(args.requests)]
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    queue = iter(requests)
+
+    async def worker() -> None:
+        for route, method, path, params, body in queue:
+            started = time.perf_counter()
+            status = await asgi_call(app, method, path, params, body)
+            latencies[route].append(time.perf_counter() - started)
+            statuses[route][status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    from services.local_cache import get_local_cache
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'commit': git_commit(),
+        'config': {
+            **vars(args),
+            **{key: value for key, value in os.environ.items() if key.startswith(('CACHE_', 'LOCAL_CACHE_'))},
+        },
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(all_latencies) / elapsed, 1),
+        'latency': percentiles(all_latencies),
+        'routes': {
+            route: {'requests': len(values), 'statuses': dict(statuses[route]), **percentiles(values)}
+            for route, values in sorted(latencies.items())
+        },
+        'cache': cache_stats(),
+        'local_cache': {'hits': get_local_cache().hits, 'misses': get_local_cache().misses},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=10000)
+    parser.add_argument('--persons', type=int, default=3000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--zipf', type=float, default=1.1, help='показатель распределения Ципфа')
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--max-pages', type=int, default=50)
+    parser.add_argument('--redis-latency-ms', type=float, default=0.2)
+    parser.add_argument('--es-latency-ms', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='файл для результата, по умолчанию stdout')
+    args = parser.parse_args()
+
+    result = asyncio.get_event_loop().run_until_complete(run(args))
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Сравнение форматов значений кэша на моделях API: размер значения (память на ключ в Redis
+без накладных расходов самого Redis) и время кодирования/декодирования.
+
+Запуск из каталога fastapi: PYTHONPATH=src python benchmarks/cache_codec.py [--number 2000]
+Недоступные форматы (не установлены msgpack, zstandard или lz4) пропускаются
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from typing import Any, Callable, List
+
+from pydantic import parse_obj_as
+from pydantic.json import pydantic_encoder
+
+from models.film import ESFilm
+from models.genre import ESGenre
+from models.person import ESPerson
+from services.cache_codec import CacheCodec
+
+WORDS = (
+    'the a of and to in film story life young man woman world war love family city secret '
+    'journey must find their past new old friends dark night home lost time truth king'
+).split()
+FORMATS = [(serializer, compression) for serializer in ('json', 'msgpack') for compression in ('none', 'zstd', 'lz4')]
+
+
+def text(words: int) -> str:
+    return ' '.join(random.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def samples(page_size: int) -> dict:
+    """Типичные значения кэша: документы каждой модели и страница фильмов в конверте SWR"""
+    films = [
+        ESFilm(id=str(uuid.uuid4()), imdb_rating=round(random.uniform(1, 10), 1), title=text(4), description=text(80))
+        for _ in range(page_size)
+    ]
+    return {
+        'film': films[0],
+        'genre': ESGenre(id=str(uuid.uuid4()), genre=text(1), description=text(20)),
+        'person': ESPerson(id=str(uuid.uuid4()), name=text(2)),
+        f'films page ({page_size})': {'data': films, 'soft_expire': time.time(), 'delta': 0.01},
+    }
+
+
+def timed(func: Callable[[], Any], number: int) -> float:
+    """Среднее время вызова в микросекундах"""
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - started) / number * 1e6
+
+
+def legacy(value: Any, number: int) -> tuple:
+    """Прежний формат: data.json() для документов и json.dumps с pydantic_encoder для страниц"""
+    if isinstance(value, dict):
+        model = type(value['data'][0])
+        encode = lambda: json.dumps(value, default=pydantic_encoder)  # noqa: E731
+        decode = lambda raw: parse_obj_as(List[model], json.loads(raw)['data'])  # noqa: E731
+    else:
+        encode, decode = value.json, type(value).parse_raw
+    raw = encode()
+    return len(raw.encode()), timed(encode, number), timed(lambda: decode(raw), number)
+
+
+def codec_result(codec: CacheCodec, value: Any, number: int) -> tuple:
+    if isinstance(value, dict):
+        model = type(value['data'][0])
+        decode = lambda raw: parse_obj_as(List[model], codec.decode(raw)['data'])  # noqa: E731
+    else:
+        decode = lambda raw: type(value).parse_obj(codec.decode(raw))  # noqa: E731
+    raw = codec.encode(value)
+    return len(raw), timed(lambda: codec.encode(value), number), timed(lambda: decode(raw), number)
+
+
+def formatted(result: tuple) -> list:
+    size, encode_time, decode_time = result
+    return [size, f'{encode_time:.1f}', f'{decode_time:.1f}']
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=2000, help='повторов на замер')
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--compress-min-bytes', type=int, default=512)
+    args = parser.parse_args()
+
+    random.seed(0)
+    row = '{:<20} {:<16} {:>10} {:>12} {:>12}'
+    print(row.format('value', 'format', 'bytes', 'encode, us', 'decode, us'))
+    for name, value in samples(args.page_size).items():
+        print(row.format(name, 'legacy json', *formatted(legacy(value, args.number))))
+        for serializer, compression in FORMATS:
+            try:
+                codec = CacheCodec(serializer, compression, args.compress_min_bytes)
+            except ValueError as error:
+                print(f'{name:<20} {serializer}+{compression:<11} skipped: {error}', file=sys.stderr)
+                continue
+            result = codec_result(codec, value, args.number)
+            print(row.format(name, f'{serializer}+{compression}', *formatted(result)))
+
+
+if __name__ == '__main__':
+    main()
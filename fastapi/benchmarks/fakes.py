@@ -0,0 +1,254 @@
+"""
+Замены Redis и Elasticsearch в памяти процесса для бенчмарков API: поддерживают ровно те вызовы
+и формы запросов, которые используют сервисы, и умеют имитировать сетевую задержку
+"""
+import asyncio
+import fnmatch
+import random
+import time
+import uuid
+from functools import cmp_to_key
+from typing import Any, Dict, List, Optional, Union
+
+from elasticsearch import NotFoundError
+
+WORDS = (
+    'star war love night city dark lost king time story world secret man woman life family house road '
+    'last first black white red blood dream fire water sky moon sun ghost game heart shadow river'
+).split()
+
+
+def text(words: int) -> str:
+    return ' '.join(random.choice(WORDS) for _ in range(words))
+
+
+def generate_catalog(films: int, persons: int, genres: int, seed: int = 0) -> Dict[str, List[dict]]:
+    """Синтетический каталог в формате документов индексов movies, persons и genres"""
+    random.seed(seed)
+    genre_docs = [
+        {'id': str(uuid.uuid4()), 'genre': f'{text(1)}-{number}', 'description': text(15)} for number in range(genres)
+    ]
+    person_docs = [{'id': str(uuid.uuid4()), 'name': text(2).title()} for _ in range(persons)]
+    film_docs = []
+    for _ in range(films):
+        actors = random.sample(person_docs, min(len(person_docs), random.randint(1, 6)))
+        writers = random.sample(person_docs, min(len(person_docs), random.randint(0, 2)))
+        film_genres = random.sample(genre_docs, min(len(genre_docs), random.randint(1, 3)))
+        film_docs.append(
+            {
+                'id': str(uuid.uuid4()),
+                'imdb_rating': round(random.uniform(1, 10), 1) if random.random() > 0.05 else None,
+                'genre': [doc['genre'] for doc in film_genres],
+                'title': text(random.randint(1, 5)).capitalize(),
+                'description': text(random.randint(20, 120)),
+                'director': text(2).title(),
+                'actors_names': [person['name'] for person in actors],
+                'writers_names': [person['name'] for person in writers],
+                'actors': actors,
+                'writers': writers,
+            }
+        )
+    return {'movies': film_docs, 'persons': person_docs, 'genres': genre_docs}
+
+
+class FakePool:
+    size = freesize = maxsize = 0
+
+
+class FakeRedis:
+    """Подмножество aioredis.Redis: get, set (expire, pexpire, exist), mget, delete, pipeline, iscan"""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.data: Dict[str, Any] = {}
+        self.expires: Dict[str, float] = {}
+        self.connection = FakePool()
+
+    async def _roundtrip(self) -> None:
+        await asyncio.sleep(self.latency)
+
+    def _alive(self, key: str) -> bool:
+        expire = self.expires.get(key)
+        if expire is not None and expire < time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _set(self, key: str, value: Any, expire: float = 0, pexpire: float = 0, exist: Optional[str] = None) -> bool:
+        if exist == 'SET_IF_NOT_EXIST' and self._alive(key):
+            return False
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        ttl = expire or pexpire / 1000
+        if ttl:
+            self.expires[key] = time.monotonic() + ttl
+        else:
+            self.expires.pop(key, None)
+        return True
+
+    async def get(self, key: str) -> Optional[bytes]:
+        await self._roundtrip()
+        return self.data.get(key) if self._alive(key) else None
+
+    async def mget(self, *keys: str) -> List[Optional[bytes]]:
+        await self._roundtrip()
+        return [self.data.get(key) if self._alive(key) else None for key in keys]
+
+    async def set(self, key: str, value: Any, **kwargs) -> bool:
+        await self._roundtrip()
+        return self._set(key, value, **kwargs)
+
+    async def delete(self, *keys: str) -> int:
+        await self._roundtrip()
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def iscan(self, match: str = '*'):
+        for key in list(self.data):
+            if fnmatch.fnmatchcase(key, match):
+                yield key
+
+    def pipeline(self) -> 'FakePipeline':
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, key: str, value: Any, **kwargs) -> None:
+        self.commands.append((key, value, kwargs))
+
+    async def execute(self) -> List[bool]:
+        await self.redis._roundtrip()
+        return [self.redis._set(key, value, **kwargs) for key, value, kwargs in self.commands]
+
+
+class FakeElasticsearch:
+    """
+    Подмножество AsyncElasticsearch: get, mget и search с bool must/filter, multi_match,
+    range, term, nested term, сортировкой с search_after и from/size
+    """
+
+    def __init__(self, catalog: Dict[str, List[dict]], latency: float = 0):
+        self.latency = latency
+        self.indices = {index: {doc['id']: doc for doc in docs} for index, docs in catalog.items()}
+
+    async def _roundtrip(self) -> None:
+        await asyncio.sleep(self.latency)
+
+    def _index(self, index: str) -> Dict[str, dict]:
+        if index not in self.indices:
+            raise NotFoundError(404, 'index_not_found_exception', {})
+        return self.indices[index]
+
+    @staticmethod
+    def _source(doc: dict, includes: Union[List[str], bool, None]) -> dict:
+        if includes is False:
+            return {}
+        return {key: value for key, value in doc.items() if includes is None or key in includes}
+
+    async def get(self, index: str, id: str, _source_includes: Optional[List[str]] = None, **kwargs) -> dict:
+        await self._roundtrip()
+        doc = self._index(index).get(id)
+        if doc is None:
+            raise NotFoundError(404, 'not_found', {})
+        return {'_index': index, '_id': id, 'found': True, '_source': self._source(doc, _source_includes)}
+
+    async def mget(self, body: dict, index: str, _source_includes: Optional[List[str]] = None, **kwargs) -> dict:
+        await self._roundtrip()
+        docs = self._index(index)
+        return {
+            'docs': [
+                {'_id': doc_id, 'found': True, '_source': self._source(docs[doc_id], _source_includes)}
+                if doc_id in docs
+                else {'_id': doc_id, 'found': False}
+                for doc_id in body['ids']
+            ]
+        }
+
+    async def search(self, index: str, body: dict, **kwargs) -> dict:
+        await self._roundtrip()
+        started = time.perf_counter()
+        query = body.get('query', {}).get('bool', {})
+        scored = []
+        for doc in self._index(index).values():
+            if not all(self._matches(doc, clause) for clause in query.get('filter', [])):
+                continue
+            score = sum(self._score(doc, clause) for clause in query.get('must', []))
+            if query.get('must') and not score:
+                continue
+            scored.append((doc, float(score or 1)))
+        sort = body.get('sort', [])
+        keyed = [(self._sort_values(doc, score, sort), doc) for doc, score in scored]
+        compare = cmp_to_key(lambda left, right: self._compare(left[0], right[0], sort))
+        keyed.sort(key=compare)
+        if 'search_after' in body:
+            keyed = [item for item in keyed if self._compare(item[0], body['search_after'], sort) > 0]
+        else:
+            keyed = keyed[body.get('from', 0):]
+        page = keyed[: body.get('size', 10)]
+        hits = {
+            'hits': [
+                {'_id': doc['id'], '_source': self._source(doc, body.get('_source')), 'sort': values}
+                for values, doc in page
+            ]
+        }
+        if body.get('track_total_hits', True):
+            hits['total'] = {'value': len(scored), 'relation': 'eq'}
+        return {'took': int((time.perf_counter() - started) * 1000), 'hits': hits}
+
+    @classmethod
+    def _matches(cls, doc: dict, clause: dict) -> bool:
+        if 'range' in clause:
+            (field, condition), = clause['range'].items()
+            value = doc.get(field)
+            return value is not None and value >= condition.get('gte', float('-inf'))
+        if 'term' in clause:
+            (field, value), = clause['term'].items()
+            if '.' in field:
+                path, key = field.split('.', 1)
+                return any(item.get(key) == value for item in doc.get(path, []))
+            current = doc.get(field)
+            return value in current if isinstance(current, list) else current == value
+        if 'nested' in clause:
+            return cls._matches(doc, clause['nested']['query'])
+        if 'bool' in clause:
+            return any(cls._matches(doc, should) for should in clause['bool'].get('should', []))
+        return True
+
+    @staticmethod
+    def _score(doc: dict, clause: dict) -> float:
+        match = clause.get('multi_match')
+        if not match:
+            return 0
+        terms = match['query'].split()
+        score = 0.0
+        for field in match['fields']:
+            name, _, boost = field.partition('^')
+            value = doc.get(name) or ''
+            value = ' '.join(value) if isinstance(value, list) else str(value)
+            score += sum(value.lower().count(term) for term in terms) * float(boost or 1)
+        return score
+
+    @staticmethod
+    def _sort_values(doc: dict, score: float, sort: List[dict]) -> list:
+        values = []
+        for item in sort:
+            (field, _), = item.items()
+            values.append(score if field == '_score' else doc.get(field.replace('.keyword', '')))
+        return values
+
+    @staticmethod
+    def _compare(left: list, right: list, sort: List[dict]) -> int:
+        for (item, a, b) in zip(sort, left, right):
+            if a == b:
+                continue
+            if a is None or b is None:
+                return 1 if a is None else -1
+            order = next(iter(item.values()))
+            result = -1 if a < b else 1
+            return result if order == 'asc' else -result
+        return 0
+
+    async def close(self) -> None:
+        pass
@@ -1,9 +1,12 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from services.film import FilmService, get_film_service
+from api.v1.pagination import set_page_headers
+from api.v1.schemas import IdsRequest
+from services.pagination import MAX_PAGE_SIZE
 from core.exception_detail import ExceptionDetail
 
 
@@ -16,6 +19,33 @@ class Film(BaseModel):
     imdb_rating: Optional[float]
 
 
+@router.get(
+    '/search',
+    response_model=List[Film],
+    summary='Полнотекстовый поиск кинопроизведений',
+    description='поиск кинопроизведений по названию, описанию и участникам с фильтрами по рейтингу и жанру',
+    response_description='Список с названием и рейтингом найденных фильмов',
+)
+async def films_search(
+    response: Response,
+    query: str = Query(..., min_length=1),
+    rating_filter: Optional[float] = None,
+    genre: Optional[str] = None,
+    page_number: int = Query(default=1, alias='page[number]', ge=1),
+    page_size: int = Query(default=20, alias='page[size]', ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, alias='page[cursor]'),
+    film_service: FilmService = Depends(get_film_service),
+) -> List[Film]:
+    page = await film_service.search(
+        'movies', query, page_number, page_size, cursor, rating_filter=rating_filter, genre=genre
+    )
+    if not page or not page.items:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=ExceptionDetail.MoviesDetails)
+
+    set_page_headers(response, page)
+    return page.items
+
+
 @router.get(
     '/{film_id}',
     response_model=Film,
@@ -34,6 +64,21 @@ async def film_details(
     return Film(id=film.id, title=film.title, imdb_rating=film.imdb_rating)
 
 
+@router.post(
+    '/_mget',
+    response_model=List[Film],
+    summary='Поиск кинопроизведений по списку id',
+    description='пакетный поиск кинопроизведений по списку id',
+    response_description='Список с названием и рейтингом найденных фильмов',
+)
+async def films_mget(
+    request: IdsRequest,
+    film_service: FilmService = Depends(get_film_service),
+) -> List[Film]:
+    films = await film_service.get_many_by_id('movies', request.ids)
+    return [Film(id=film.id, title=film.title, imdb_rating=film.imdb_rating) for film in films]
+
+
 @router.get(
     '/movies/',
     response_model=List[Film],
@@ -42,15 +87,19 @@ async def film_details(
     response_description='Список с названием и рейтингом фильма',
 )
 async def movies_details(
+    response: Response,
     rating_filter: float = None,
+    genre: Optional[str] = None,
     sort: bool = False,
     page_number: int = Query(default=1, alias='page[number]', ge=1),
-    page_size: int = Query(default=20, alias='page[size]', ge=1),
+    page_size: int = Query(default=20, alias='page[size]', ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, alias='page[cursor]'),
     film_service: FilmService = Depends(get_film_service),
 ) -> List[Film]:
 
-    films = await film_service.get_page_number('movies', rating_filter, sort, page_number, page_size)
-    if not films:
+    page = await film_service.get_page_number('movies', rating_filter, sort, page_number, page_size, cursor, genre)
+    if not page or not page.items:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=ExceptionDetail.MoviesDetails)
 
-    return films
+    set_page_headers(response, page)
+    return page.items
@@ -1,9 +1,12 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from services.genre import GenreService, get_genre_service
+from api.v1.pagination import set_page_headers
+from api.v1.schemas import IdsRequest
+from services.pagination import MAX_PAGE_SIZE
 from core.exception_detail import ExceptionDetail
 
 router = APIRouter()
@@ -14,6 +17,23 @@ class Genre(BaseModel):
     genre: str
 
 
+@router.get('/search', response_model=List[Genre])
+async def genres_search(
+    response: Response,
+    query: str = Query(..., min_length=1),
+    page_number: int = Query(default=1, alias='page[number]', ge=1),
+    page_size: int = Query(default=5, alias='page[size]', ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, alias='page[cursor]'),
+    genre_service: GenreService = Depends(get_genre_service),
+) -> List[Genre]:
+    page = await genre_service.search('genres', query, page_number, page_size, cursor)
+    if not page or not page.items:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=ExceptionDetail.GenresDetails)
+
+    set_page_headers(response, page)
+    return page.items
+
+
 @router.get('/{genre_id}', response_model=Genre)
 async def genre_details(
     genre_id: str = Query(default='6c162475-c7ed-4461-9184-001ef3d9f26e'),
@@ -26,16 +46,28 @@ async def genre_details(
     return Genre(id=genre.id, genre=genre.genre)
 
 
+@router.post('/_mget', response_model=List[Genre])
+async def genres_mget(
+    request: IdsRequest,
+    genre_service: GenreService = Depends(get_genre_service),
+) -> List[Genre]:
+    genres = await genre_service.get_many_by_id('genres', request.ids)
+    return [Genre(id=genre.id, genre=genre.genre) for genre in genres]
+
+
 @router.get('/genres/', response_model=List[Genre])
 async def genres_details(
+    response: Response,
     sort: bool = False,
     page_number: int = Query(default=1, alias='page[number]', ge=1),
-    page_size: int = Query(default=5, alias='page[size]', ge=1),
+    page_size: int = Query(default=5, alias='page[size]', ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, alias='page[cursor]'),
     genre_service: GenreService = Depends(get_genre_service),
 ) -> List[Genre]:
 
-    genres = await genre_service.get_page_number('genres', sort, page_number, page_size)
-    if not genres:
+    page = await genre_service.get_page_number('genres', sort, page_number, page_size, cursor)
+    if not page or not page.items:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=ExceptionDetail.GenresDetails)
 
-    return genres
+    set_page_headers(response, page)
+    return page.items
@@ -0,0 +1,14 @@
+from fastapi import Response
+
+from services.base_service import Page
+
+
+def set_page_headers(response: Response, page: Page) -> None:
+    """
+    Общее число найденных документов (Elasticsearch считает до 10000, дальше это нижняя граница)
+    и курсор следующей страницы (page[cursor])
+    """
+    if page.total is not None:
+        response.headers['X-Total-Count'] = str(page.total)
+    if page.next_cursor:
+        response.headers['X-Next-Cursor'] = page.next_cursor
@@ -1,9 +1,14 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from services.film import FilmService, get_film_service
 from services.person import PersonService, get_person_service
+from api.v1.films import Film
+from api.v1.pagination import set_page_headers
+from api.v1.schemas import IdsRequest
+from services.pagination import MAX_PAGE_SIZE
 from core.exception_detail import ExceptionDetail
 
 router = APIRouter()
@@ -14,6 +19,23 @@ class Person(BaseModel):
     name: str
 
 
+@router.get('/search', response_model=List[Person])
+async def persons_search(
+    response: Response,
+    query: str = Query(..., min_length=1),
+    page_number: int = Query(default=1, alias='page[number]', ge=1),
+    page_size: int = Query(default=5, alias='page[size]', ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, alias='page[cursor]'),
+    person_service: PersonService = Depends(get_person_service),
+) -> List[Person]:
+    page = await person_service.search('persons', query, page_number, page_size, cursor)
+    if not page or not page.items:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=ExceptionDetail.PersonsDetails)
+
+    set_page_headers(response, page)
+    return page.items
+
+
 @router.get('/{person_id}', response_model=Person)
 async def person_details(
     person_id: str = Query(default='e039eedf-4daf-452a-bf92-a0085c68e156'),
@@ -26,16 +48,45 @@ async def person_details(
     return Person(id=person.id, name=person.name)
 
 
+@router.get('/{person_id}/films', response_model=List[Film])
+async def person_films(
+    response: Response,
+    person_id: str,
+    page_number: int = Query(default=1, alias='page[number]', ge=1),
+    page_size: int = Query(default=20, alias='page[size]', ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, alias='page[cursor]'),
+    film_service: FilmService = Depends(get_film_service),
+) -> List[Film]:
+    page = await film_service.get_person_films('movies', person_id, page_number, page_size, cursor)
+    if not page or not page.items:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=ExceptionDetail.PersonFilmsDetails)
+
+    set_page_headers(response, page)
+    return page.items
+
+
+@router.post('/_mget', response_model=List[Person])
+async def persons_mget(
+    request: IdsRequest,
+    person_service: PersonService = Depends(get_person_service),
+) -> List[Person]:
+    persons = await person_service.get_many_by_id('persons', request.ids)
+    return [Person(id=person.id, name=person.name) for person in persons]
+
+
 @router.get('/persons/', response_model=List[Person])
 async def persons_details(
+    response: Response,
     sort: bool = False,
     page_number: int = Query(default=1, alias='page[number]', ge=1),
-    page_size: int = Query(default=5, alias='page[size]', ge=1),
+    page_size: int = Query(default=5, alias='page[size]', ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, alias='page[cursor]'),
     person_service: PersonService = Depends(get_person_service),
 ) -> List[Person]:
 
-    persons = await person_service.get_page_number('persons', sort, page_number, page_size)
-    if not persons:
+    page = await person_service.get_page_number('persons', sort, page_number, page_size, cursor)
+    if not page or not page.items:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=ExceptionDetail.PersonsDetails)
 
-    return persons
+    set_page_headers(response, page)
+    return page.items
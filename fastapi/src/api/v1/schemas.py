@@ -0,0 +1,7 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class IdsRequest(BaseModel):
+    ids: List[str] = Field(..., min_items=1, max_items=100)
@@ -26,6 +26,26 @@ class ProjectSettings(BaseSettings):
     ELASTIC_PORT = Field(9200, env='ELASTIC_PORT')
     ES_USER = Field('elastic', env='ES_USER')
     ES_PASSWORD = Field('changeme', env='ES_PASSWORD')
-    CACHE_EXPIRE_IN_SECONDS = Field(300, env='CACHE_EXPIRE_IN_SECONDS')
+    CACHE_EXPIRE_IN_SECONDS = Field(3600, env='CACHE_EXPIRE_IN_SECONDS')
+    CACHE_SWR_ENABLED = Field(False, env='CACHE_SWR_ENABLED')
+    CACHE_STALE_IN_SECONDS = Field(60, env='CACHE_STALE_IN_SECONDS')
+    CACHE_XFETCH_BETA = Field(1.0, env='CACHE_XFETCH_BETA')
+    CACHE_LOCK_ENABLED = Field(False, env='CACHE_LOCK_ENABLED')
+    CACHE_LOCK_TIMEOUT_MS = Field(5000, env='CACHE_LOCK_TIMEOUT_MS')
+    CACHE_CHANGES_CHANNEL = Field('etl::changes', env='CACHE_CHANGES_CHANNEL')
+    # Формат значений кэша: json или msgpack, сжатие none, zstd или lz4
+    CACHE_SERIALIZER = Field('json', env='CACHE_SERIALIZER')
+    CACHE_COMPRESSION = Field('none', env='CACHE_COMPRESSION')
+    CACHE_COMPRESS_MIN_BYTES = Field(512, env='CACHE_COMPRESS_MIN_BYTES')
+    # Локальный кэш воркера
+    LOCAL_CACHE_MAX_BYTES = Field(64 * 1024 * 1024, env='LOCAL_CACHE_MAX_BYTES')
+    LOCAL_CACHE_TTL_SECONDS = Field(30, env='LOCAL_CACHE_TTL_SECONDS')
+    # Метрики Prometheus (/metrics)
+    METRICS_ENABLED = Field(True, env='METRICS_ENABLED')
+    # Трассировка: спаны медленных (TRACE_SLOW_MS) и доли остальных запросов пишутся в OTLP/JSON
+    TRACING_ENABLED = Field(False, env='TRACING_ENABLED')
+    TRACE_SAMPLE_RATE = Field(0.01, env='TRACE_SAMPLE_RATE')
+    TRACE_SLOW_MS = Field(500, env='TRACE_SLOW_MS')
+    TRACE_EXPORT_PATH = Field('-', env='TRACE_EXPORT_PATH')
     BASE_DIR = Field(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -5,3 +5,6 @@ class ExceptionDetail:
     GenresDetails = 'genres not found'
     PersonDetails = 'person not found'
     PersonsDetails = 'persons not found'
+    PersonFilmsDetails = 'person films not found'
+    InvalidCursor = 'invalid page cursor'
+    PageTooDeep = 'page is beyond 10000 results, use page[cursor] to go further'
@@ -0,0 +1,65 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from aioredis import Redis
+from prometheus_client import Counter, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+from core.tracing import span
+
+REQUEST_LATENCY = Histogram(
+    'api_request_duration_seconds', 'Время обработки запроса', ['method', 'route', 'status']
+)
+CACHE_REQUESTS = Counter(
+    'api_cache_requests_total', 'Обращения к кэшу по семействам ключей', ['index', 'family', 'layer', 'result']
+)
+ES_ROUND_TRIP = Histogram('api_es_round_trip_seconds', 'Время запроса к Elasticsearch на клиенте', ['operation'])
+ES_TOOK = Histogram('api_es_took_seconds', 'Время выполнения запроса внутри Elasticsearch (took)', ['operation'])
+PARSE_TIME = Histogram(
+    'api_model_parse_seconds',
+    'Время построения моделей pydantic',
+    ['model'],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05),
+)
+REDIS_POOL_SIZE = Gauge('api_redis_pool_size', 'Открытые соединения пула aioredis')
+REDIS_POOL_FREE = Gauge('api_redis_pool_freesize', 'Свободные соединения пула aioredis')
+REDIS_POOL_MAX = Gauge('api_redis_pool_maxsize', 'Максимальный размер пула aioredis')
+
+
+def route_path(app, scope: dict) -> str:
+    """Шаблон пути маршрута (/api/v1/films/{film_id}), чтобы число меток не зависело от id"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+def observe_cache(index: str, family: str, layer: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(index, family, layer, 'hit' if hit else 'miss').inc()
+
+
+def observe_es(operation: str, started: float, response: Optional[dict]) -> None:
+    ES_ROUND_TRIP.labels(operation).observe(time.perf_counter() - started)
+    if response and 'took' in response:
+        ES_TOOK.labels(operation).observe(response['took'] / 1000)
+
+
+@contextmanager
+def parse_timer(model: type) -> Iterator[None]:
+    started = time.perf_counter()
+    with span('parse', model=model.__name__):
+        yield
+    PARSE_TIME.labels(model.__name__).observe(time.perf_counter() - started)
+
+
+def render_metrics(redis: Optional[Redis]) -> bytes:
+    """Метрики в формате Prometheus, заполненность пула Redis снимается в момент запроса"""
+    if redis is not None:
+        pool = redis.connection
+        REDIS_POOL_SIZE.set(pool.size)
+        REDIS_POOL_FREE.set(pool.freesize)
+        REDIS_POOL_MAX.set(pool.maxsize)
+    return generate_latest()
+
@@ -0,0 +1,180 @@
+import inspect
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+from core.config import ProjectSettings
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'kind', 'start_ns', 'end_ns', 'attributes')
+
+    def __init__(self, name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = self.start_ns
+        self.attributes = attributes
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self, trace_id: str) -> dict:
+        data = {
+            'traceId': trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [
+                {'key': key, 'value': {'stringValue': str(value)}} for key, value in self.attributes.items()
+            ],
+        }
+        if self.parent_id:
+            data['parentSpanId'] = self.parent_id
+        return data
+
+
+class Trace:
+    """Спаны одного запроса: собираются в памяти, экспортируются только для выбранных запросов"""
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(name, None, SPAN_KIND_SERVER, attributes)
+        self.spans: List[Span] = [self.root]
+
+    def finish(self) -> None:
+        self.root.end_ns = time.time_ns()
+
+    def server_timing(self) -> str:
+        """Заголовок Server-Timing: суммарное время по именам спанов и общее время запроса"""
+        totals: Dict[str, float] = {}
+        for item in self.spans[1:]:
+            totals[item.name] = totals.get(item.name, 0) + item.duration_ms
+        metrics = [f'{name.replace(".", "-")};dur={duration:.2f}' for name, duration in totals.items()]
+        metrics.append(f'total;dur={self.root.duration_ms:.2f}')
+        return ', '.join(metrics)
+
+    def sampled(self, settings: ProjectSettings) -> bool:
+        """Медленные запросы экспортируются всегда, остальные - с вероятностью TRACE_SAMPLE_RATE"""
+        return self.root.duration_ms >= settings.TRACE_SLOW_MS or random.random() < settings.TRACE_SAMPLE_RATE
+
+    def to_otlp(self, service_name: str) -> dict:
+        return {
+            'resourceSpans': [
+                {
+                    'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+                    'scopeSpans': [
+                        {
+                            'scope': {'name': f'{service_name}.tracing'},
+                            'spans': [item.to_otlp(self.trace_id) for item in self.spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, start_ns: Optional[int] = None, **attributes) -> Iterator[None]:
+    """Спан внутри текущего запроса; вне запроса (или с выключенной трассировкой) ничего не делает"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    parent = current_span.get() or trace.root
+    item = Span(name, parent.span_id, kind, attributes)
+    if start_ns is not None:
+        item.start_ns = start_ns
+    trace.spans.append(item)
+    token = current_span.set(item)
+    try:
+        yield
+    finally:
+        item.end_ns = time.time_ns()
+        current_span.reset(token)
+
+
+def traced(name: str) -> Callable:
+    """Декоратор корутины: вызов записывается спаном name"""
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def _traced_await(name: str, start_ns: int, awaitable: Awaitable[Any]) -> Any:
+    with span(name, SPAN_KIND_CLIENT, start_ns):
+        return await awaitable
+
+
+class TracedClient:
+    """
+    Обертка клиента (aioredis, AsyncElasticsearch): каждый вызов, возвращающий awaitable,
+    записывается клиентским спаном {prefix}.{метод}, остальные атрибуты отдаются как есть
+    """
+
+    def __init__(self, client: Any, prefix: str):
+        self._client = client
+        self._prefix = prefix
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            start_ns = time.time_ns()
+            result = attr(*args, **kwargs)
+            if current_trace.get() is None or not inspect.isawaitable(result):
+                return result
+            return _traced_await(f'{self._prefix}.{name}', start_ns, result)
+
+        return call
+
+
+def traced_client(client: Any, prefix: str) -> Any:
+    return TracedClient(client, prefix) if ProjectSettings().TRACING_ENABLED else client
+
+
+class TracedORJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        with span('render'):
+            return super().render(content)
+
+
+def export_trace(trace: Trace, settings: ProjectSettings) -> None:
+    """Запись трассы строкой OTLP/JSON в файл TRACE_EXPORT_PATH или в stdout ('-')"""
+    line = orjson.dumps(trace.to_otlp(settings.PROJECT_NAME)) + b'\n'
+    if settings.TRACE_EXPORT_PATH == '-':
+        sys.stdout.buffer.write(line)
+        sys.stdout.flush()
+        return
+    with open(settings.TRACE_EXPORT_PATH, 'ab') as file:
+        file.write(line)
@@ -1,18 +1,28 @@
+import asyncio
+import time
+from http import HTTPStatus
+
 import aioredis
 import uvicorn
 from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.responses import ORJSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from api.v1 import films, genres, persons
 from core.config import ProjectSettings
+from core.exception_detail import ExceptionDetail
+from core.metrics import REQUEST_LATENCY, render_metrics, route_path
+from core.tracing import Trace, TracedORJSONResponse, current_trace, export_trace, traced_client
 from db import elastic, redis
+from services.invalidation import listen_changes
+from services.pagination import InvalidCursor, PageTooDeep
 
 app = FastAPI(
     title=ProjectSettings().PROJECT_NAME,
     docs_url='/api/openapi',
     openapi_url='/api/openapi.json',
-    default_response_class=ORJSONResponse,
+    default_response_class=TracedORJSONResponse if ProjectSettings().TRACING_ENABLED else ORJSONResponse,
     description='Информация о фильмах, жанрах и людях, участвовавших в создании произведения',
     version='1.0.0',
 )
@@ -20,23 +30,85 @@ app = FastAPI(
 
 @app.on_event('startup')
 async def startup():
-    redis.redis = await aioredis.create_redis_pool(
-        (ProjectSettings().REDIS_HOST, ProjectSettings().REDIS_PORT), minsize=10, maxsize=20
+    redis.redis = traced_client(
+        await aioredis.create_redis_pool(
+            (ProjectSettings().REDIS_HOST, ProjectSettings().REDIS_PORT), minsize=10, maxsize=20
+        ),
+        'redis',
     )
-    elastic.es = AsyncElasticsearch(
-        hosts=[f'{ProjectSettings().ELASTIC_HOST}:{ProjectSettings().ELASTIC_PORT}'],
-        basic_auth=(ProjectSettings().ES_USER, ProjectSettings().ES_PASSWORD),
-        verify_certs=False,
+    elastic.es = traced_client(
+        AsyncElasticsearch(
+            hosts=[f'{ProjectSettings().ELASTIC_HOST}:{ProjectSettings().ELASTIC_PORT}'],
+            basic_auth=(ProjectSettings().ES_USER, ProjectSettings().ES_PASSWORD),
+            verify_certs=False,
+        ),
+        'es',
     )
+    app.state.invalidation = asyncio.create_task(listen_changes(redis.redis))
 
 
 @app.on_event('shutdown')
 async def shutdown():
+    app.state.invalidation.cancel()
     redis.redis.close()
     await redis.redis.wait_closed()
     await elastic.es.close()
 
 
+async def request_metrics(request: Request, call_next):
+    """Гистограмма времени ответа по шаблону маршрута, методу и статусу"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUEST_LATENCY.labels(request.method, route_path(app, request.scope), status).observe(
+            time.perf_counter() - started
+        )
+
+
+async def request_tracing(request: Request, call_next):
+    """
+    Трасса запроса: спаны Redis, Elasticsearch, сервисов, разбора моделей и рендера ответа.
+    Сводка добавляется в заголовок Server-Timing, выбранные трассы экспортируются
+    """
+    trace = Trace(f'{request.method} {route_path(app, request.scope)}', target=request.url.path)
+    token = current_trace.set(trace)
+    try:
+        response = await call_next(request)
+    finally:
+        current_trace.reset(token)
+        trace.finish()
+    response.headers['Server-Timing'] = trace.server_timing()
+    if trace.sampled(tracing_settings):
+        export_trace(trace, tracing_settings)
+    return response
+
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor) -> ORJSONResponse:
+    return ORJSONResponse(status_code=HTTPStatus.BAD_REQUEST, content={'detail': ExceptionDetail.InvalidCursor})
+
+
+@app.exception_handler(PageTooDeep)
+async def page_too_deep_handler(request: Request, exc: PageTooDeep) -> ORJSONResponse:
+    return ORJSONResponse(status_code=HTTPStatus.BAD_REQUEST, content={'detail': ExceptionDetail.PageTooDeep})
+
+
+async def metrics() -> Response:
+    return Response(render_metrics(redis.redis), media_type=CONTENT_TYPE_LATEST)
+
+
+if ProjectSettings().METRICS_ENABLED:
+    app.middleware('http')(request_metrics)
+    app.get('/metrics', include_in_schema=False)(metrics)
+if ProjectSettings().TRACING_ENABLED:
+    tracing_settings = ProjectSettings()
+    app.middleware('http')(request_tracing)
+
+
 app.include_router(films.router, prefix='/api/v1/films', tags=['films'])
 app.include_router(genres.router, prefix='/api/v1/genres', tags=['genres'])
 app.include_router(persons.router, prefix='/api/v1/persons', tags=['persons'])
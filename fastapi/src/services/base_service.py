@@ -1,85 +1,395 @@
-import json
-from typing import Optional, List
-from pydantic import parse_raw_as
-from pydantic.json import pydantic_encoder
+import asyncio
+import math
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, List
+
 from aioredis import Redis
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch import AsyncElasticsearch, NotFoundError, RequestError
 from fastapi import Query
 
 from core.config import ProjectSettings
+from core.metrics import observe_cache, observe_es, parse_timer
+from core.tracing import traced
 from models.base_model import BaseModel
+from services.cache_codec import get_cache_codec
+from services.cache_keys import data_key, key_family, page_tag
+from services.invalidation import get_generation
+from services.local_cache import get_local_cache
+from services.pagination import InvalidCursor, encode_cursor
+from services.query_builder import SearchQuery, normalize_query, query_hash, source_fields
+from services.single_flight import SingleFlight
+
+
+class CacheEntry(NamedTuple):
+    data: Any
+    refresh: bool = False
+
+
+class PageIds(NamedTuple):
+    ids: List[str]
+    total: Optional[int]
+    next_cursor: Optional[str] = None
+
+
+class Page(NamedTuple):
+    items: List[BaseModel]
+    total: Optional[int]
+    next_cursor: Optional[str] = None
 
 
 class BaseService:
+    LOCK_POLL_INTERVAL = 0.05
+    SEARCH_FIELDS: List[str] = []
+
     def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
         self.redis = redis
         self.elastic = elastic
+        self.settings = ProjectSettings()
         self.model = BaseModel
+        self.single_flight = SingleFlight()
+        self.local_cache = get_local_cache()
+        self.codec = get_cache_codec()
+        self._refresh_tasks = set()
+
+    @staticmethod
+    def _data_key(es_index: str, data_id: str) -> str:
+        return data_key(es_index, data_id)
+
+    @staticmethod
+    def _page_tag(redis_key: str) -> str:
+        return page_tag(redis_key.split('::', 1)[0])
+
+    async def _page_key(self, es_index: str, **params) -> str:
+        """Ключ страницы: индекс, текущее поколение его страниц и параметры запроса"""
+        generation = await get_generation(self.redis, es_index)
+        parts = [f'{key}::{value}' for key, value in params.items()]
+        return '::'.join([es_index, 'generation', str(generation), *parts])
+
+    async def _generation_unchanged(self, es_index: str, generation: int) -> bool:
+        """
+        Записи документов кэшируются, только если поколение индекса не сменилось с момента до запроса
+        в Elasticsearch: иначе загрузка могла прочитать документ до записи ETL и положить его в кэш
+        уже после удаления ключа событием сброса
+        """
+        return await get_generation(self.redis, es_index) == generation
 
+    @staticmethod
+    def _observe_cache(redis_key: str, layer: str, hit: bool) -> None:
+        observe_cache(redis_key.split('::', 1)[0], key_family(redis_key), layer, hit)
+
+    @staticmethod
+    async def _elastic_call(operation: str, call: Awaitable[dict]) -> dict:
+        """Запрос к Elasticsearch с замером времени на клиенте и took из ответа"""
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await call
+            return response
+        finally:
+            observe_es(operation, started, response)
+
+    @traced('service.get_by_id')
     async def get_by_id(self, es_index: str, data_id: str) -> Optional[BaseModel]:
-        data = await self._data_from_cache(f'{es_index}::data_id::{data_id}')
-        if not data:
-            data = await self._get_from_elastic(es_index, data_id)
-            if not data:
-                return None
-            await self._put_data_to_cache(f'{es_index}::data_id::{data_id}', data)
+        generation = await get_generation(self.redis, es_index)
+        return await self._get_or_load(
+            self._data_key(es_index, data_id),
+            self._data_from_cache,
+            lambda: self._get_from_elastic(es_index, data_id),
+            lambda redis_key, data, delta: self._put_data_to_cache(es_index, generation, redis_key, data, delta),
+        )
+
+    async def _get_or_load(
+        self,
+        redis_key: str,
+        from_cache: Callable[[str], Awaitable[Optional[CacheEntry]]],
+        from_elastic: Callable[[], Awaitable[Any]],
+        to_cache: Callable[[str, Any, float], Awaitable[None]],
+    ) -> Any:
+        """
+        Чтение из локального кэша воркера, затем из Redis, а при промахе - одна загрузка
+        из Elasticsearch на ключ (single-flight). Если запись в Redis устарела или выбрана
+        для раннего обновления, отдается она, а перезагрузка идет в фоне
+        """
+        data = self.local_cache.get(redis_key)
+        self._observe_cache(redis_key, 'local', data is not None)
+        if data is not None:
+            return data
+        cached = await from_cache(redis_key)
+        self._observe_cache(redis_key, 'redis', bool(cached and cached.data))
+        if cached and cached.data:
+            if cached.refresh:
+                self._refresh_in_background(redis_key, from_cache, from_elastic, to_cache)
+            return cached.data
+        return await self.single_flight.do(
+            redis_key, lambda: self._load_with_lock(redis_key, from_cache, from_elastic, to_cache)
+        )
+
+    def _refresh_in_background(
+        self,
+        redis_key: str,
+        from_cache: Callable[[str], Awaitable[Optional[CacheEntry]]],
+        from_elastic: Callable[[], Awaitable[Any]],
+        to_cache: Callable[[str, Any, float], Awaitable[None]],
+    ) -> None:
+        task = asyncio.ensure_future(
+            self.single_flight.do(
+                redis_key, lambda: self._load_with_lock(redis_key, from_cache, from_elastic, to_cache, refresh=True)
+            )
+        )
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _load_with_lock(
+        self,
+        redis_key: str,
+        from_cache: Callable[[str], Awaitable[Optional[CacheEntry]]],
+        from_elastic: Callable[[], Awaitable[Any]],
+        to_cache: Callable[[str, Any, float], Awaitable[None]],
+        refresh: bool = False,
+    ) -> Any:
+        """
+        Загрузка из Elasticsearch с записью в кэш. С CACHE_LOCK_ENABLED ключ пересчитывает
+        только воркер, взявший блокировку в Redis, остальные ждут появления значения в кэше
+        (при фоновом обновлении - просто пропускают его)
+        """
+        lock_key = f'{redis_key}::lock'
+        locked = False
+        if self.settings.CACHE_LOCK_ENABLED:
+            locked = await self.redis.set(
+                lock_key, '1', pexpire=self.settings.CACHE_LOCK_TIMEOUT_MS, exist=Redis.SET_IF_NOT_EXIST
+            )
+            if not locked:
+                if refresh:
+                    return None
+                data = await self._wait_for_cache(redis_key, from_cache)
+                if data:
+                    return data
+        try:
+            started = time.monotonic()
+            data = await from_elastic()
+            if data:
+                await to_cache(redis_key, data, time.monotonic() - started)
+            return data
+        finally:
+            if locked:
+                await self.redis.delete(lock_key)
+
+    async def _wait_for_cache(
+        self, redis_key: str, from_cache: Callable[[str], Awaitable[Optional[CacheEntry]]]
+    ) -> Any:
+        deadline = time.monotonic() + self.settings.CACHE_LOCK_TIMEOUT_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.LOCK_POLL_INTERVAL)
+            cached = await from_cache(redis_key)
+            if cached and cached.data:
+                return cached.data
+        return None
+
+    @traced('service.get_many_by_id')
+    async def get_many_by_id(self, es_index: str, data_ids: List[str]) -> List[BaseModel]:
+        """
+        Пакетное получение по списку id: один MGET в Redis, ES mget только для промахов,
+        заполнение кэша одним pipeline. Порядок id сохраняется, ненайденные пропускаются
+        """
+        data_ids = list(dict.fromkeys(data_ids))
+        data = {}
+        for data_id in data_ids:
+            item = self.local_cache.get(self._data_key(es_index, data_id))
+            observe_cache(es_index, 'data_id', 'local', item is not None)
+            if item is not None:
+                data[data_id] = item
+        misses = [data_id for data_id in data_ids if data_id not in data]
+        if misses:
+            data.update(await self._many_by_id_from_cache(es_index, misses))
+            misses = [data_id for data_id in misses if data_id not in data]
+        if misses:
+            generation = await get_generation(self.redis, es_index)
+            found = await self._mget_from_elastic(es_index, misses)
+            if found:
+                await self._put_many_by_id_to_cache(es_index, generation, found)
+                data.update({item.id: item for item in found})
+        return [data[data_id] for data_id in data_ids if data_id in data]
+
+    async def _many_by_id_from_cache(self, es_index: str, data_ids: List[str]) -> Dict[str, BaseModel]:
+        keys = [self._data_key(es_index, data_id) for data_id in data_ids]
+        values = await self.redis.mget(*keys)
+        data = {}
+        for key, data_id, value in zip(keys, data_ids, values):
+            observe_cache(es_index, 'data_id', 'redis', bool(value))
+            if value:
+                with parse_timer(self.model):
+                    data[data_id] = self.model.parse_obj(self.codec.decode(value))
+                self.local_cache.put(key, data[data_id], len(value))
         return data
 
+    async def _mget_from_elastic(self, es_index: str, data_ids: List[str]) -> List[BaseModel]:
+        try:
+            docs = await self._elastic_call(
+                'mget',
+                self.elastic.mget(body={'ids': data_ids}, index=es_index, _source_includes=source_fields(self.model)),
+            )
+        except NotFoundError:
+            return []
+        with parse_timer(self.model):
+            return [self.model(**doc['_source']) for doc in docs['docs'] if doc.get('found')]
+
+    async def _put_many_by_id_to_cache(self, es_index: str, generation: int, data: List[BaseModel]) -> None:
+        if not await self._generation_unchanged(es_index, generation):
+            return
+        pipeline = self.redis.pipeline()
+        for item in data:
+            key, value = self._data_key(es_index, item.id), self.codec.encode(item)
+            pipeline.set(key, value, expire=self.settings.CACHE_EXPIRE_IN_SECONDS)
+            self.local_cache.put(key, item, len(value))
+        await pipeline.execute()
+
     async def _get_from_elastic(self, es_index: str, data_id: str) -> Optional[BaseModel]:
         try:
-            doc = await self.elastic.get(es_index, data_id)
+            doc = await self._elastic_call(
+                'get', self.elastic.get(es_index, data_id, _source_includes=source_fields(self.model))
+            )
         except NotFoundError:
             return None
-        return self.model(**doc['_source'])
+        with parse_timer(self.model):
+            return self.model(**doc['_source'])
 
-    async def _data_from_cache(self, redis_key: str) -> Optional[BaseModel]:
-        data = await self.redis.get(redis_key)
-        if not data:
+    async def _data_from_cache(self, redis_key: str) -> Optional[CacheEntry]:
+        value = await self.redis.get(redis_key)
+        if not value:
             return None
-        data = self.model.parse_raw(data)
-        return data
+        with parse_timer(self.model):
+            data = self.model.parse_obj(self.codec.decode(value))
+        self.local_cache.put(redis_key, data, len(value))
+        return CacheEntry(data)
 
-    async def _put_data_to_cache(self, redis_key: str, data: BaseModel) -> None:
-        await self.redis.set(redis_key, data.json(), expire=ProjectSettings().CACHE_EXPIRE_IN_SECONDS)
+    async def _put_data_to_cache(
+        self, es_index: str, generation: int, redis_key: str, data: BaseModel, delta: float = 0
+    ) -> None:
+        if not await self._generation_unchanged(es_index, generation):
+            return
+        value = self.codec.encode(data)
+        await self.redis.set(redis_key, value, expire=self.settings.CACHE_EXPIRE_IN_SECONDS)
+        self.local_cache.put(redis_key, data, len(value))
 
     async def get_page_number(
-        self, es_index: str, sort: bool, page_number: int, page_size: int
-    ) -> Optional[BaseModel]:
-        data = await self._many_data_from_cache(
-            f'{es_index}::sort::{sort}::page_number::{page_number}::page_size::{page_size}'
+        self, es_index: str, sort: bool, page_number: int, page_size: int, cursor: Optional[str] = None
+    ) -> Optional[Page]:
+        return await self._get_page(
+            es_index,
+            await self._page_key(es_index, sort=sort, page_number=page_number, page_size=page_size, cursor=cursor),
+            lambda: self._get_data_from_elastic(es_index, sort, page_number, page_size, cursor),
         )
-        if not data:
-            data = await self._get_data_from_elastic(es_index, sort, page_number, page_size)
-            if not data:
-                return None
-            await self._put_many_data_to_cache(
-                f'{es_index}::sort::{sort}::page_number::{page_number}::page_size::{page_size}',
-                data,
-            )
-        return data
+
+    @traced('service.get_page')
+    async def _get_page(
+        self, es_index: str, redis_key: str, from_elastic: Callable[[], Awaitable[Optional[PageIds]]]
+    ) -> Optional[Page]:
+        """
+        Страница кэшируется как список id и общее число документов, сами документы
+        собираются из кэша записей одним MGET, в Elasticsearch запрашиваются только промахи
+        """
+        page = await self._get_or_load(redis_key, self._page_from_cache, from_elastic, self._put_page_to_cache)
+        if page is None:
+            return None
+        return Page(await self.get_many_by_id(es_index, page.ids), page.total, page.next_cursor)
 
     async def _get_data_from_elastic(
-        self, es_index: str, sort: bool, page_number: int, data_on_page: int
-    ) -> Optional[List[BaseModel]]:
+        self, es_index: str, sort: bool, page_number: int, data_on_page: int, cursor: Optional[str] = None
+    ) -> Optional[PageIds]:
+        sort_field = f"{'genre' if es_index == 'genres' else 'name'}.keyword"
+        query = SearchQuery().order_by(sort_field, sort).page(page_number, data_on_page, cursor)
+        return await self._search_page(es_index, query.build())
+
+    @traced('service.search')
+    async def search(
+        self, es_index: str, query: str, page_number: int, page_size: int, cursor: Optional[str] = None, **filters
+    ) -> Optional[Page]:
+        """
+        Полнотекстовый поиск по SEARCH_FIELDS. Результаты кэшируются как страницы
+        по нормализованному запросу, поэтому повторяющиеся запросы не доходят до Elasticsearch
+        """
+        query = normalize_query(query)
+        return await self._get_page(
+            es_index,
+            await self._page_key(
+                es_index,
+                search=query_hash(query),
+                **filters,
+                page_number=page_number,
+                page_size=page_size,
+                cursor=cursor,
+            ),
+            lambda: self._search_in_elastic(es_index, query, page_number, page_size, cursor, **filters),
+        )
+
+    def _search_filters(self, **filters) -> List[dict]:
+        """Условия поиска в контексте фильтра, переопределяется в сервисах с фильтрами"""
+        return []
+
+    async def _search_in_elastic(
+        self, es_index: str, query: str, page_number: int, page_size: int, cursor: Optional[str] = None, **filters
+    ) -> Optional[PageIds]:
+        search_query = SearchQuery().multi_match(query, self.SEARCH_FIELDS)
+        for clause in self._search_filters(**filters):
+            search_query.filter(clause)
+        search_query.page(page_number, page_size, cursor)
+        return await self._search_page(es_index, search_query.build())
+
+    async def _search_page(self, es_index: str, body: dict) -> Optional[PageIds]:
+        """
+        Поиск страницы: запоминаются только id найденных документов, сами документы собирает
+        get_many_by_id. Если страница полная, из значений сортировки последнего документа
+        строится курсор следующей страницы. Курсор, значения которого Elasticsearch не принял
+        для search_after (например, другого типа), - InvalidCursor
+        """
         try:
-            data = await self.elastic.search(
-                index=es_index,
-                from_=page_number,
-                size=data_on_page,
-                sort=f"{'genre' if es_index == 'genres' else 'name'}.keyword:{'asc' if sort else 'desc'}",
-            )
+            data = await self._elastic_call('search', self.elastic.search(index=es_index, body=body))
         except NotFoundError:
             return None
-        return [self.model(**_['_source']) for _ in data['hits']['hits']]
+        except RequestError:
+            if 'search_after' in body:
+                raise InvalidCursor(f'Invalid search_after: {body["search_after"]}')
+            raise
+        hits = data['hits']['hits']
+        next_cursor = encode_cursor(hits[-1]['sort']) if hits and len(hits) == body['size'] else None
+        total = data['hits']['total']['value'] if 'total' in data['hits'] else None
+        return PageIds([hit['_id'] for hit in hits], total, next_cursor)
 
-    async def _many_data_from_cache(self, redis_key: str) -> Optional[List[BaseModel]]:
-        data = await self.redis.get(redis_key)
-        if not data:
+    async def _page_from_cache(self, redis_key: str) -> Optional[CacheEntry]:
+        """
+        Страница из кэша вместе с признаком фонового обновления: запись устарела (soft TTL)
+        или выбрана для раннего вероятностного обновления (XFetch)
+        """
+        value = await self.redis.get(redis_key)
+        if not value:
             return None
-        data = parse_raw_as(List[self.model], data)
-        return data
+        envelope = self.codec.decode(value)
+        page = PageIds(envelope['ids'], envelope['total'], envelope.get('next_cursor'))
+        self.local_cache.put(redis_key, page, len(value), self._page_tag(redis_key))
+        return CacheEntry(page, self._should_refresh(envelope['soft_expire'], envelope['delta']))
 
-    async def _put_many_data_to_cache(self, redis_key: str, data: List[BaseModel]) -> None:
-        await self.redis.set(
-            redis_key, json.dumps(data, default=pydantic_encoder), expire=ProjectSettings().CACHE_EXPIRE_IN_SECONDS
+    async def _put_page_to_cache(self, redis_key: str, page: PageIds, delta: float = 0) -> None:
+        """
+        Страница хранится до hard TTL (soft TTL + CACHE_STALE_IN_SECONDS), после soft TTL
+        она отдается устаревшей и обновляется в фоне
+        """
+        soft_ttl = self.settings.CACHE_EXPIRE_IN_SECONDS
+        hard_ttl = soft_ttl + (self.settings.CACHE_STALE_IN_SECONDS if self.settings.CACHE_SWR_ENABLED else 0)
+        value = self.codec.encode(
+            {
+                'ids': page.ids,
+                'total': page.total,
+                'next_cursor': page.next_cursor,
+                'soft_expire': time.time() + soft_ttl,
+                'delta': delta,
+            }
         )
+        await self.redis.set(redis_key, value, expire=hard_ttl)
+        self.local_cache.put(redis_key, page, len(value), self._page_tag(redis_key))
+
+    def _should_refresh(self, soft_expire: float, delta: float) -> bool:
+        """XFetch: чем дольше пересчет и ближе истечение, тем вероятнее раннее обновление"""
+        if not self.settings.CACHE_SWR_ENABLED:
+            return False
+        return time.time() - delta * self.settings.CACHE_XFETCH_BETA * math.log(1 - random.random()) >= soft_expire
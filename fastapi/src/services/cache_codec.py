@@ -0,0 +1,107 @@
+import struct
+from functools import lru_cache
+from typing import Any, Callable, Dict, Tuple
+
+import orjson
+from pydantic.json import pydantic_encoder
+
+from core.config import ProjectSettings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+class CacheCodec:
+    """
+    Сериализация значений кэша. По умолчанию - orjson без заголовка (совместимо с parse_raw).
+    Для msgpack и/или сжатия значение пишется кадром: байт версии формата, id сериализатора,
+    id компрессора и полезная нагрузка. Значения без заголовка читаются как orjson,
+    поэтому смена формата не требует сброса кэша
+    """
+
+    FRAME_VERSION = 0x01
+    HEADER = struct.Struct('BBB')
+    SERIALIZERS = {'json': 0, 'msgpack': 1}
+    COMPRESSIONS = {'none': 0, 'zstd': 1, 'lz4': 2}
+
+    def __init__(self, serializer: str = 'json', compression: str = 'none', compress_min_bytes: int = 0):
+        if serializer not in self.SERIALIZERS:
+            raise ValueError(f'Unknown cache serializer: {serializer}')
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f'Unknown cache compression: {compression}')
+        if serializer == 'msgpack' and msgpack is None:
+            raise ValueError('Cache serializer msgpack requires the msgpack package')
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError('Cache compression zstd requires the zstandard package')
+        if compression == 'lz4' and lz4 is None:
+            raise ValueError('Cache compression lz4 requires the lz4 package')
+        self.serializer = serializer
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self.framed = serializer != 'json' or compression != 'none'
+        self._serializers = self._serializer_funcs()
+        self._dumps = self._serializers[serializer][0]
+        self._compressors = self._compressor_funcs()
+
+    @staticmethod
+    def _serializer_funcs() -> Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]]:
+        funcs = {'json': (lambda obj: orjson.dumps(obj, default=pydantic_encoder), orjson.loads)}
+        if msgpack is not None:
+            funcs['msgpack'] = (
+                lambda obj: msgpack.packb(obj, default=pydantic_encoder, use_bin_type=True),
+                lambda value: msgpack.unpackb(value, raw=False),
+            )
+        return funcs
+
+    @staticmethod
+    def _compressor_funcs() -> Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]:
+        funcs = {'none': (bytes, bytes)}
+        if zstandard is not None:
+            funcs['zstd'] = (zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress)
+        if lz4 is not None:
+            funcs['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+        return funcs
+
+    def encode(self, obj: Any) -> bytes:
+        payload = self._dumps(obj)
+        if not self.framed:
+            return payload
+        compression = self.compression if len(payload) >= self.compress_min_bytes else 'none'
+        header = self.HEADER.pack(self.FRAME_VERSION, self.SERIALIZERS[self.serializer], self.COMPRESSIONS[compression])
+        return header + self._compressors[compression][0](payload)
+
+    def decode(self, value: bytes) -> Any:
+        if not value or value[0] != self.FRAME_VERSION:
+            return orjson.loads(value)
+        _, serializer_id, compression_id = self.HEADER.unpack_from(value)
+        serializer = self._name(self.SERIALIZERS, serializer_id)
+        compression = self._name(self.COMPRESSIONS, compression_id)
+        if serializer not in self._serializers or compression not in self._compressors:
+            raise ValueError(f'Cache value encoded with unavailable {serializer}/{compression}')
+        payload = self._compressors[compression][1](value[self.HEADER.size:])
+        return self._serializers[serializer][1](payload)
+
+    @staticmethod
+    def _name(ids: Dict[str, int], value_id: int) -> str:
+        return next((name for name, known_id in ids.items() if known_id == value_id), str(value_id))
+
+
+@lru_cache()
+def get_cache_codec() -> CacheCodec:
+    return CacheCodec(
+        ProjectSettings().CACHE_SERIALIZER,
+        ProjectSettings().CACHE_COMPRESSION,
+        ProjectSettings().CACHE_COMPRESS_MIN_BYTES,
+    )
@@ -0,0 +1,26 @@
+def data_key(es_index: str, data_id: str) -> str:
+    return f'{es_index}::data_id::{data_id}'
+
+
+def page_tag(es_index: str) -> str:
+    return f'{es_index}::pages'
+
+
+def generation_key(es_index: str) -> str:
+    return f'{es_index}::generation'
+
+
+def key_family(redis_key: str) -> str:
+    """
+    Семейство ключа для метрик: data_id - записи, search - поиск, person_films - фильмография,
+    page - остальные страницы (es_index::generation::N::param::value::...)
+    """
+    parts = redis_key.split('::')
+    if len(parts) > 1 and parts[1] == 'data_id':
+        return 'data_id'
+    params = parts[3::2]
+    if 'search' in params:
+        return 'search'
+    if 'person' in params:
+        return 'person_films'
+    return 'page'
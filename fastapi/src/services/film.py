@@ -1,58 +1,100 @@
 from functools import lru_cache
-from typing import Optional, List
+from typing import List, Optional
 from aioredis import Redis
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 
-from services.base_service import BaseService
+from services.base_service import BaseService, Page, PageIds
+from services.query_builder import SearchQuery
 from db.elastic import get_elastic
 from db.redis import get_redis
 from models.film import ESFilm
 
 
 class FilmService(BaseService):
+    SEARCH_FIELDS = ['title^3', 'actors_names^2', 'director^2', 'writers_names', 'description']
+
     def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
         super().__init__(redis, elastic)
         self.model = ESFilm
 
     async def get_page_number(
-        self, es_index: str, rating_filter: float, sort: bool, page_number: int, page_size: int
-    ) -> Optional[List[ESFilm]]:
-        data = await self._many_data_from_cache(
-            f'{es_index}::rating_filter::{rating_filter}::sort::{sort}::page_number::{page_number}::page_size::{page_size}'
+        self,
+        es_index: str,
+        rating_filter: float,
+        sort: bool,
+        page_number: int,
+        page_size: int,
+        cursor: Optional[str] = None,
+        genre: Optional[str] = None,
+    ) -> Optional[Page]:
+        return await self._get_page(
+            es_index,
+            await self._page_key(
+                es_index,
+                rating_filter=rating_filter,
+                genre=genre,
+                sort=sort,
+                page_number=page_number,
+                page_size=page_size,
+                cursor=cursor,
+            ),
+            lambda: self._get_data_from_elastic(es_index, rating_filter, sort, page_number, page_size, cursor, genre),
         )
-        if not data:
-            data = await self._get_data_from_elastic(es_index, rating_filter, sort, page_number, page_size)
-            if not data:
-                return None
-            await self._put_many_data_to_cache(
-                f'{es_index}::rating_filter::{rating_filter}::sort::{sort}::page_number::{page_number}::page_size::{page_size}',
-                data,
-            )
-        return data
 
     async def _get_data_from_elastic(
-        self, es_index: str, rating_filter: float, sort: bool, page_number: int, data_on_page: int
-    ) -> Optional[List[ESFilm]]:
-        try:
-            data = await self.elastic.search(
-                index=es_index,
-                from_=page_number,
-                body={
-                    'query': {
-                        'range': {
-                            'imdb_rating': {
-                                'gte': rating_filter if rating_filter else 0,
-                            }
-                        }
-                    }
-                },
-                size=data_on_page,
-                sort=f"imdb_rating:{'asc' if sort else 'desc'}",
-            )
-        except NotFoundError:
-            return None
-        return [self.model(**_['_source']) for _ in data['hits']['hits']]
+        self,
+        es_index: str,
+        rating_filter: float,
+        sort: bool,
+        page_number: int,
+        data_on_page: int,
+        cursor: Optional[str] = None,
+        genre: Optional[str] = None,
+    ) -> Optional[PageIds]:
+        query = SearchQuery().filter({'range': {'imdb_rating': {'gte': rating_filter if rating_filter else 0}}})
+        if genre:
+            query.filter({'term': {'genre': genre}})
+        query.order_by('imdb_rating', sort).page(page_number, data_on_page, cursor)
+        return await self._search_page(es_index, query.build())
+
+    async def get_person_films(
+        self, es_index: str, person_id: str, page_number: int, page_size: int, cursor: Optional[str] = None
+    ) -> Optional[Page]:
+        """
+        Фильмография: фильмы, где человек указан среди актеров или сценаристов. Страницы кэшируются
+        в поколении индекса фильмов, изменение связей человека с фильмами переиндексирует фильмы
+        и сбрасывает их
+        """
+        return await self._get_page(
+            es_index,
+            await self._page_key(
+                es_index, person=person_id, page_number=page_number, page_size=page_size, cursor=cursor
+            ),
+            lambda: self._person_films_from_elastic(es_index, person_id, page_number, page_size, cursor),
+        )
+
+    async def _person_films_from_elastic(
+        self, es_index: str, person_id: str, page_number: int, page_size: int, cursor: Optional[str] = None
+    ) -> Optional[PageIds]:
+        roles = [
+            {'nested': {'path': role, 'query': {'term': {f'{role}.id': person_id}}}} for role in ('actors', 'writers')
+        ]
+        query = (
+            SearchQuery()
+            .filter({'bool': {'should': roles, 'minimum_should_match': 1}})
+            .order_by('imdb_rating', False)
+            .page(page_number, page_size, cursor)
+        )
+        return await self._search_page(es_index, query.build())
+
+    def _search_filters(self, rating_filter: Optional[float] = None, genre: Optional[str] = None) -> List[dict]:
+        filters = []
+        if rating_filter is not None:
+            filters.append({'range': {'imdb_rating': {'gte': rating_filter}}})
+        if genre:
+            filters.append({'term': {'genre': genre}})
+        return filters
 
 
 @lru_cache()
@@ -11,6 +11,8 @@ from models.genre import ESGenre
 
 
 class GenreService(BaseService):
+    SEARCH_FIELDS = ['genre^2', 'description']
+
     def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
         super().__init__(redis, elastic)
         self.model = ESGenre
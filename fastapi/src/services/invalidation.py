@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from aioredis import Redis
+
+from core.config import ProjectSettings
+from services.cache_keys import data_key, generation_key, page_tag
+from services.local_cache import get_local_cache
+
+logger = logging.getLogger(__name__)
+
+# Время жизни отметки о том, что событие уже обработано одним из воркеров
+EVENT_EXPIRE_IN_SECONDS = 60
+
+# Поколения страниц по индексам: номер поколения входит в ключ каждой страницы,
+# поэтому смена поколения делает все закэшированные страницы индекса недостижимыми
+generations: Dict[str, int] = {}
+
+
+async def get_generation(redis: Redis, es_index: str) -> int:
+    if es_index not in generations:
+        generations[es_index] = int(await redis.get(generation_key(es_index)) or 0)
+    return generations[es_index]
+
+
+async def invalidate(redis: Redis, es_index: str, data_ids: Optional[List[str]], version: int) -> None:
+    """
+    Сброс кэша по событию ETL: записи измененных документов и смена поколения страниц индекса.
+    data_ids = None означает изменение всего индекса. Ключи в Redis удаляет только один воркер,
+    взявший событие, локальные кэши сбрасывают все
+    """
+    local_cache = get_local_cache()
+    generations[es_index] = max(generations.get(es_index, 0), version)
+    if data_ids is None:
+        local_cache.invalidate_prefix(f'{es_index}::')
+    else:
+        local_cache.invalidate([data_key(es_index, data_id) for data_id in data_ids], tag=page_tag(es_index))
+
+    event_key = f'{ProjectSettings().CACHE_CHANGES_CHANNEL}::{es_index}::{version}'
+    if not await redis.set(event_key, '1', expire=EVENT_EXPIRE_IN_SECONDS, exist=Redis.SET_IF_NOT_EXIST):
+        return
+    if data_ids is None:
+        keys = [key async for key in redis.iscan(match=data_key(es_index, '*'))]
+    else:
+        keys = [data_key(es_index, data_id) for data_id in data_ids]
+    if keys:
+        await redis.delete(*keys)
+    await redis.set(generation_key(es_index), version)
+
+
+async def listen_changes(redis: Redis) -> None:
+    """
+    Подписка на канал, в который ETL публикует id документов после каждой записи в Elasticsearch.
+    После переподключения локальное состояние сбрасывается, так как события могли быть пропущены
+    """
+    while True:
+        try:
+            channel, = await redis.subscribe(ProjectSettings().CACHE_CHANGES_CHANNEL)
+            generations.clear()
+            get_local_cache().clear()
+            while await channel.wait_message():
+                message = await channel.get_json()
+                await invalidate(redis, message['index'], message.get('ids'), message['version'])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Error listening to cache invalidation events')
+        await asyncio.sleep(1)
@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from core.config import ProjectSettings
+
+
+class LocalCache:
+    """
+    Ограниченный по объему LRU-кэш воркера для уже разобранных моделей.
+    Объем записи оценивается по размеру ее сериализованного значения в Redis
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[str, Tuple[Any, int, float, Optional[str]]]' = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None or item[2] < time.monotonic():
+            if item is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key: str, value: Any, size: int, tag: Optional[str] = None) -> None:
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._data[key] = (value, size, time.monotonic() + self.ttl, tag)
+        self.size += size
+        if tag:
+            self._tags.setdefault(tag, set()).add(key)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._data)))
+
+    def invalidate(self, keys: Iterable[str] = (), tag: Optional[str] = None) -> None:
+        """Удаление записей по ключам и всех записей с тегом tag"""
+        for key in keys:
+            self._remove(key)
+        for key in self._tags.pop(tag, set()) if tag else ():
+            self._remove(key)
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        for key in [key for key in self._data if key.startswith(prefix)]:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._tags.clear()
+        self.size = 0
+
+    def _remove(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        self.size -= item[1]
+        tag = item[3]
+        if tag and tag in self._tags:
+            self._tags[tag].discard(key)
+
+
+@lru_cache()
+def get_local_cache() -> LocalCache:
+    return LocalCache(ProjectSettings().LOCAL_CACHE_MAX_BYTES, ProjectSettings().LOCAL_CACHE_TTL_SECONDS)
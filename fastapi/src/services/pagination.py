@@ -0,0 +1,44 @@
+import base64
+import binascii
+from typing import Any, List
+
+import orjson
+
+
+MAX_PAGE_SIZE = 100
+# index.max_result_window Elasticsearch по умолчанию: глубже from + size страницы по номеру не отдаются
+MAX_RESULT_WINDOW = 10000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class PageTooDeep(ValueError):
+    pass
+
+
+def check_result_window(page_number: int, page_size: int) -> None:
+    if (page_number - 1) * page_size + page_size > MAX_RESULT_WINDOW:
+        raise PageTooDeep(f'Page {page_number} of size {page_size} is beyond {MAX_RESULT_WINDOW} results')
+
+
+def encode_cursor(sort_values: List[Any]) -> str:
+    """Курсор search_after: значения сортировки последнего документа страницы в base64url"""
+    return base64.urlsafe_b64encode(orjson.dumps(sort_values)).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Значения search_after из курсора: по одному скалярному значению на каждое поле сортировки (size)"""
+    try:
+        sort_values = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor(f'Invalid page cursor: {cursor}')
+    if (
+        not isinstance(sort_values, list)
+        or len(sort_values) != size
+        or not all(value is None or isinstance(value, (str, int, float)) for value in sort_values)
+    ):
+        raise InvalidCursor(f'Invalid page cursor: {cursor}')
+    return sort_values
+
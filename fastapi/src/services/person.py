@@ -11,6 +11,8 @@ from models.person import ESPerson
 
 
 class PersonService(BaseService):
+    SEARCH_FIELDS = ['name']
+
     def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
         super().__init__(redis, elastic)
         self.model = ESPerson
@@ -0,0 +1,87 @@
+import hashlib
+import re
+from typing import List, Optional, Type
+
+from pydantic import BaseModel
+
+from services.pagination import check_result_window, decode_cursor
+
+
+def source_fields(model: Type[BaseModel]) -> List[str]:
+    """Поля _source, нужные для построения модели: остальное Elasticsearch не передает"""
+    return list(model.__fields__)
+
+
+def normalize_query(query: str) -> str:
+    """Поисковая строка без различий в регистре и пробелах: одинаковые запросы попадают в один ключ кэша"""
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha1(query.encode()).hexdigest()
+
+
+class SearchQuery:
+    """
+    Построитель тела запроса к Elasticsearch. Условия в filter не влияют на релевантность,
+    выполняются без подсчета score и кэшируются Elasticsearch; без условий в must
+    запрос выполняется целиком в контексте фильтра. Поиск возвращает только id (_source не передается):
+    документы страницы читаются через кэш записей и mget
+    """
+
+    def __init__(self):
+        self.must: List[dict] = []
+        self.filters: List[dict] = []
+        self.sort: List[dict] = [{'_score': 'desc'}]
+        self.size = 10
+        self.offset = 0
+        self.search_after: Optional[list] = None
+        self.track_total_hits: Optional[bool] = None
+
+    def match(self, clause: dict) -> 'SearchQuery':
+        self.must.append(clause)
+        return self
+
+    def multi_match(self, query: str, fields: List[str]) -> 'SearchQuery':
+        """Полнотекстовый поиск по полям с весами (title^3) с учетом опечаток"""
+        return self.match({'multi_match': {'query': query, 'fields': fields, 'fuzziness': 'AUTO'}})
+
+    def filter(self, clause: dict) -> 'SearchQuery':
+        self.filters.append(clause)
+        return self
+
+    def order_by(self, field: str, ascending: bool) -> 'SearchQuery':
+        self.sort = [{field: 'asc' if ascending else 'desc'}]
+        return self
+
+    def page(self, page_number: int, page_size: int, cursor: Optional[str] = None) -> 'SearchQuery':
+        """
+        Страница по номеру или по курсору (search_after). Для страниц по номеру Elasticsearch считает
+        документы как по умолчанию, до 10000, при проходе курсором счет выключен.
+        Страница по номеру за пределами MAX_RESULT_WINDOW - PageTooDeep, дальше только курсором.
+        Курсор проверяется по числу полей сортировки, поэтому order_by вызывается до page
+        """
+        self.size = page_size
+        if cursor:
+            self.search_after = decode_cursor(cursor, len(self.sort) + 1)
+            self.track_total_hits = False
+        else:
+            check_result_window(page_number, page_size)
+            self.offset = (page_number - 1) * page_size
+        return self
+
+    def build(self) -> dict:
+        """Тело запроса; id - дополнительный ключ сортировки, чтобы порядок был однозначным"""
+        body = {
+            '_source': False,
+            'query': {'bool': {'must': self.must, 'filter': self.filters}},
+            'sort': [*self.sort, {'id': 'asc'}],
+            'size': self.size,
+        }
+        if self.track_total_hits is not None:
+            body['track_total_hits'] = self.track_total_hits
+        if self.search_after is not None:
+            body['search_after'] = self.search_after
+        else:
+            body['from'] = self.offset
+        return body
@@ -0,0 +1,21 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Дедупликация одновременных запросов: пока загрузка по ключу выполняется,
+    остальные вызовы с тем же ключом ждут ее результат, а не запускают свою
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield: отмена одного из ожидающих запросов не отменяет общую загрузку
+        return await asyncio.shield(call)
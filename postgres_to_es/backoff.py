@@ -13,28 +13,27 @@ def backoff(start_sleep_time: float = 0.1, factor: int = 2, border_sleep_time: i
     :param start_sleep_time: начальное время повтора
     :param factor: во сколько раз нужно увеличить время ожидания
     :param border_sleep_time: граничное время ожидания
-    :return: результат выполнения функции
+    :return: результат выполнения функции; если ошибка повторилась и при граничном времени ожидания,
+        исключение поднимается, чтобы вызывающий код не принял неудачу за пустой результат
     """
 
     def func_wrapper(func):
         @wraps(func)
         def inner(*args, **kwargs):
             sleep_time = 0
-            result = None
 
-            while sleep_time <= border_sleep_time:
+            while True:
                 try:
                     sleep(sleep_time)
-                    result = func(*args, *kwargs)
-                    break
-                except Exception as error:
+                    return func(*args, **kwargs)
+                except Exception:
                     logger.error("Error backoff decorator")
+                    if sleep_time >= border_sleep_time:
+                        raise
                     if sleep_time == 0:
                         sleep_time = start_sleep_time
                     else:
-                        sleep_time = sleep_time * 2**factor if sleep_time < border_sleep_time else border_sleep_time
-
-            return result
+                        sleep_time = min(sleep_time * 2**factor, border_sleep_time)
 
         return inner
 
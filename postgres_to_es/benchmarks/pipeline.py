@@ -0,0 +1,201 @@
+"""
+Бенчмарк конвейера фильмов extract -> transform -> load на сгенерированных данных:
+Postgres заменен курсором в памяти, отвечающим на запросы PSExtract, Elasticsearch - приемником _bulk,
+который разбирает только строки действий. Результат - JSON со временем стадий и скоростями.
+
+Запуск из каталога postgres_to_es:
+    PYTHONPATH=. python benchmarks/pipeline.py --films 20000 [--parallel] [--raw] [--pg-latency-ms 2 --es-latency-ms 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from elasticsearch.serializer import JSONSerializer
+
+WORDS = (
+    'star war love night city dark lost king time story world secret man woman life family house road '
+    'last first black white red blood dream fire water sky moon sun ghost game heart shadow river'
+).split()
+ROLES = ('actor', 'actor', 'actor', 'writer', 'director')
+
+
+def text(words: int) -> str:
+    return ' '.join(random.choice(WORDS) for _ in range(words))
+
+
+def generate_films(films: int, persons: int, genres: int, seed: int = 0) -> List[dict]:
+    """Строки в формате результата PSExtract.extract_filmwork_data, упорядоченные по (modified, id)"""
+    random.seed(seed)
+    person_rows = [(str(uuid.uuid4()), text(2).title()) for _ in range(persons)]
+    genre_names = [f'{text(1)}-{number}' for number in range(genres)]
+    started = datetime(2021, 1, 1)
+    rows = []
+    for number in range(films):
+        modified = started + timedelta(seconds=number)
+        film_persons = random.sample(person_rows, random.randint(2, 10))
+        roles = [(random.choice(ROLES), {'id': person_id, 'name': name}) for person_id, name in film_persons]
+        film_id = str(uuid.uuid4())
+        rows.append(
+            {
+                'id': film_id,
+                'modified': modified,
+                'fw_id': film_id,
+                'title': text(random.randint(1, 5)).capitalize(),
+                'description': text(random.randint(20, 120)),
+                'rating': round(random.uniform(1, 10), 1),
+                'actors': [person for role, person in roles if role == 'actor'],
+                'writers': [person for role, person in roles if role == 'writer'],
+                'directors': [person['name'] for role, person in roles if role == 'director'],
+                'genres': random.sample(genre_names, random.randint(1, 3)),
+            }
+        )
+    return rows
+
+
+def document_source(row: dict) -> str:
+    """JSON-текст _source, который в режиме ETL_RAW_DOCUMENTS собирает Postgres"""
+    return json.dumps(
+        {
+            'id': row['fw_id'],
+            'imdb_rating': row['rating'],
+            'genre': row['genres'],
+            'title': row['title'],
+            'description': row['description'],
+            'director': row['directors'],
+            'actors_names': [person['name'] for person in row['actors']],
+            'writers_names': [person['name'] for person in row['writers']],
+            'actors': row['actors'],
+            'writers': row['writers'],
+        }
+    )
+
+
+class FakeCursor:
+    """
+    Курсор Postgres в памяти: keyset-выборка измененных фильмов, агрегаты фильмов по id
+    и готовые документы (JSON-текст заранее сериализуется, как это сделал бы Postgres)
+    """
+
+    def __init__(self, rows: List[dict], latency: float = 0):
+        self.rows = rows
+        self.by_id = {row['id']: row for row in rows}
+        self.documents = {row['id']: {'id': row['id'], 'source': document_source(row)} for row in rows}
+        self.keys = [(row['modified'], row['id']) for row in rows]
+        self.latency = latency
+        self.result = []
+
+    def execute(self, query: str, params: Optional[dict] = None) -> None:
+        time.sleep(self.latency)
+        if 'as source' in query:
+            self.result = [self.documents[_] for _ in params['ids'] if _ in self.documents]
+        elif 'jsonb_agg' in query:
+            self.result = [self.by_id[_] for _ in params['ids'] if _ in self.by_id]
+        elif 'FROM content.film_work t' in query:
+            cursor = (datetime.fromisoformat(params['cursor_modified']), params['cursor_id'])
+            start = bisect_right(self.keys, cursor)
+            self.result = self.rows[start : start + params['limit']]
+        else:
+            self.result = []
+
+    def fetchall(self) -> list:
+        return self.result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor: FakeCursor):
+        self._cursor = cursor
+
+    def cursor(self, *args, **kwargs) -> FakeCursor:
+        return self._cursor
+
+    def commit(self) -> None:
+        pass
+
+
+class FakeTransport:
+    def __init__(self, latency: float = 0):
+        self.serializer = JSONSerializer()
+        self.latency = latency
+
+    def perform_request(self, method, url, headers=None, params=None, body=None):
+        """Ответ _bulk: каждое действие успешно, разбираются только строки действий"""
+        time.sleep(self.latency)
+        lines = body.splitlines() if isinstance(body, str) else body.decode().splitlines()
+        items = []
+        for line in lines[::2]:
+            (action, meta), = json.loads(line).items()
+            items.append({action: {'_index': meta.get('_index'), '_id': meta.get('_id'), 'status': 201}})
+        return {'took': 1, 'errors': False, 'items': items}
+
+
+class FakeElasticsearch:
+    """Приемник helpers.bulk/parallel_bulk: запросы проходят через transport.perform_request"""
+
+    def __init__(self, latency: float = 0):
+        self.transport = FakeTransport(latency)
+
+    def bulk(self, body, index=None, doc_type=None, params=None, headers=None, **kwargs):
+        return self.transport.perform_request('POST', '/_bulk', headers=headers, params=params, body=body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=10000)
+    parser.add_argument('--persons', type=int, default=3000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--parallel', action='store_true', help='загрузка через helpers.parallel_bulk')
+    parser.add_argument('--raw', action='store_true', help='документы собирает Postgres (ETL_RAW_DOCUMENTS)')
+    parser.add_argument('--pg-latency-ms', type=float, default=0)
+    parser.add_argument('--es-latency-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['ETL_PUBLISH_CHANGES'] = 'False'
+    os.environ['ETL_STREAM'] = 'False'
+    os.environ['ES_BULK_PARALLEL'] = str(args.parallel)
+    os.environ['ETL_RAW_DOCUMENTS'] = str(args.raw)
+
+    from etl_process import EtlProcess
+    from load import ESLoad
+    from state import MemoryStorage, State
+    from stats import stats
+
+    rows = generate_films(args.films, args.persons, args.genres, args.seed)
+    curs = FakeCursor(rows, args.pg_latency_ms / 1000)
+    es_loader = ESLoad('', '', '', es=FakeElasticsearch(args.es_latency_ms / 1000))
+
+    started = time.perf_counter()
+    EtlProcess.check_and_update(
+        FakeConnection(curs), curs, es_loader, State(MemoryStorage()), index='movies', model_names=['film_work']
+    )
+    elapsed = time.perf_counter() - started
+
+    counters = stats.snapshot()
+    stages = {}
+    for (stage, name), value in sorted(counters.items()):
+        stages.setdefault(stage, {})[name] = round(value, 4)
+    result = {
+        'config': vars(args),
+        'elapsed_s': round(elapsed, 3),
+        'docs_per_s': round(counters.get(('load', 'docs'), 0) / elapsed, 1),
+        'rows_per_s': round(counters.get(('extract', 'rows'), 0) / elapsed, 1),
+        'stages': stages,
+    }
+    sys.stdout.write(json.dumps(result, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -13,3 +13,34 @@ class ElasticSettings(BaseSettings):
     es_host: str = ...
     es_user: str = ...
     es_password: str = ...
+
+
+class RedisSettings(BaseSettings):
+    redis_host: str = Field('redis', env='REDIS_HOST')
+    redis_port: int = Field(6379, env='REDIS_PORT')
+    publish_changes: bool = Field(True, env='ETL_PUBLISH_CHANGES')
+    changes_channel: str = Field('etl::changes', env='CACHE_CHANGES_CHANNEL')
+
+
+class EtlSettings(BaseSettings):
+    stream: bool = Field(False, env='ETL_STREAM')
+    watermark_lag: float = Field(1, env='ETL_WATERMARK_LAG')
+    state_backend: str = Field('json', env='ETL_STATE_BACKEND')
+    state_sqlite_path: str = Field('state.db', env='ETL_STATE_SQLITE_PATH')
+    pg_pool_size: int = Field(5, env='ETL_PG_POOL_SIZE')
+    movies_interval: float = Field(1, env='ETL_MOVIES_INTERVAL')
+    persons_interval: float = Field(1, env='ETL_PERSONS_INTERVAL')
+    genres_interval: float = Field(1, env='ETL_GENRES_INTERVAL')
+    notify: bool = Field(False, env='ETL_NOTIFY')
+    notify_batch_window: float = Field(0.1, env='ETL_NOTIFY_BATCH_WINDOW')
+    notify_batch_size: int = Field(500, env='ETL_NOTIFY_BATCH_SIZE')
+    sweep_interval: float = Field(60, env='ETL_SWEEP_INTERVAL')
+    bulk_parallel: bool = Field(False, env='ES_BULK_PARALLEL')
+    bulk_thread_count: int = Field(4, env='ES_BULK_THREAD_COUNT')
+    bulk_chunk_size: int = Field(500, env='ES_BULK_CHUNK_SIZE')
+    bulk_max_chunk_bytes: int = Field(10 * 1024 * 1024, env='ES_BULK_MAX_CHUNK_BYTES')
+    bulk_max_retries: int = Field(3, env='ES_BULK_MAX_RETRIES')
+    stats_interval: float = Field(60, env='ETL_STATS_INTERVAL')
+    metrics_port: int = Field(0, env='ETL_METRICS_PORT')
+    validate_documents: bool = Field(False, env='ETL_VALIDATE_DOCUMENTS')
+    raw_documents: bool = Field(False, env='ETL_RAW_DOCUMENTS')
@@ -1,4 +1,4 @@
-from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 from extract import PSExtract
 from psycopg2.extensions import connection as _connection
 from psycopg2.extras import DictCursor
@@ -6,65 +6,129 @@ from psycopg2.extras import DictCursor
 from transform import *
 from load import ESLoad
 from state import State
+from config import EtlSettings
 
 
 class EtlProcess:
     MODEL_NAMES = ['film_work', 'person', 'genre']
+    DEDUP_MAX_IDS = 10000
 
     @staticmethod
-    def init_process(pg_conn: _connection, curs: DictCursor, es_connect: dict, state: State):
-        last_modified = state.get_state("last_modified")
-        offset = state.get_state("offset")
-        postgres_extractor = PSExtract(pg_conn, curs, offset)
-        es_loader = ESLoad(**es_connect)
-        return last_modified, postgres_extractor, es_loader
+    def init_process(pg_conn: _connection, curs: DictCursor, state: State) -> PSExtract:
+        settings = EtlSettings()
+        cursor = state.get_state("cursor")
+        return PSExtract(pg_conn, curs, cursor, settings.stream, settings.watermark_lag)
 
+    @staticmethod
+    def commit_state(state: State) -> Callable[[dict], None]:
+        def commit(checkpoint: dict) -> None:
+            state.set_states(checkpoint)
 
-    def check_and_update(pg_conn: _connection, curs: DictCursor, es_connect: dict, state: State):
-        last_modified, postgres_extractor, es_loader = EtlProcess.init_process(pg_conn, curs, es_connect, state)
-        for model_name in EtlProcess.MODEL_NAMES:
-            while True:
-                filmwork_data = postgres_extractor.extract_filmwork_data(last_modified, model_name)
-                if filmwork_data:
-                    transformed_filmwork_data = [parse_from_postgres_to_es(_) for _ in filmwork_data]
-                    es_loader.send_data(es_loader.es, transformed_filmwork_data)
+        return commit
 
-                    postgres_extractor.offset += len(filmwork_data)
-                    state.set_state("offset", postgres_extractor.offset)
-                    state.set_state('last_modified', filmwork_data[-1]['modified'].strftime('%Y-%m-%d'))
-                else:
-                    postgres_extractor.offset = 0
-                    state.set_state("offset", 0)
-                    break
+    @staticmethod
+    def build_filmworks(postgres_extractor: PSExtract, filmwork_ids: List[str]) -> list:
+        """
+        Документы фильмов по id: словари из агрегированных строк или, при ETL_RAW_DOCUMENTS,
+        готовый JSON-текст, собранный в Postgres
+        """
+        settings = EtlSettings()
+        validate = settings.validate_documents
+        transformed_filmwork_data = []
+        for i in range(0, len(filmwork_ids), PSExtract.LIMIT_ROWS):
+            ids = filmwork_ids[i : i + PSExtract.LIMIT_ROWS]
+            if settings.raw_documents:
+                filmwork_data = postgres_extractor.extract_filmwork_documents(ids)
+                transformed_filmwork_data.extend(transform_filmwork_documents(filmwork_data, validate))
+            else:
+                filmwork_data = postgres_extractor.extract_filmwork_data(ids)
+                transformed_filmwork_data.extend(transform_filmworks(filmwork_data, validate))
+        return transformed_filmwork_data
 
-    def check_and_update_persons(pg_conn: _connection, curs: DictCursor, es_connect: dict, state: State):
-        last_modified, postgres_extractor, es_loader = EtlProcess.init_process(pg_conn, curs, es_connect, state)
-        while True:
-            data = postgres_extractor.extract_person_data(last_modified)
-            if data:
-                transformed_data = [parse_persons_postgres_to_es(_) for _ in data]
-                es_loader.send_persons_data(es_loader.es, transformed_data)
+    def check_and_update(
+        pg_conn: _connection,
+        curs: DictCursor,
+        es_loader: ESLoad,
+        state: State,
+        index: str = 'movies',
+        model_names: Iterable[str] = MODEL_NAMES,
+    ):
+        """
+        Producer -> enricher -> merger: собираем id измененных фильмов, персон и жанров,
+        находим затронутые ими кинопроизведения и перестраиваем каждое из них один раз за проход.
+        Загруженные id запоминаются только для следующих источников (в последнем и в единственном,
+        как при переиндексации, - нет) и не больше DEDUP_MAX_IDS: после этого повторы просто
+        перезаписывают документ, а множество не растет до размера каталога
+        """
+        postgres_extractor = EtlProcess.init_process(pg_conn, curs, state)
+        model_names = list(model_names)
+        loaded_ids = set()
 
-                postgres_extractor.offset += len(data)
-                state.set_state("offset", postgres_extractor.offset)
-                state.set_state('last_modified', datetime.now().strftime('%Y-%m-%d'))
-            else:
-                postgres_extractor.offset = 0
-                state.set_state("offset", 0)
-                break
+        def batches(model_name: str, track: bool) -> Iterator[Tuple[list, dict]]:
+            for changed_data in postgres_extractor.changed_batches(model_name):
+                changed_ids = [str(row['id']) for row in changed_data]
+                filmwork_ids = postgres_extractor.extract_filmwork_ids(model_name, changed_ids)
+                filmwork_ids = [_ for _ in dict.fromkeys(filmwork_ids) if _ not in loaded_ids]
+                transformed_filmwork_data = EtlProcess.build_filmworks(postgres_extractor, filmwork_ids)
+                if track and len(loaded_ids) < EtlProcess.DEDUP_MAX_IDS:
+                    loaded_ids.update(filmwork_ids)
 
-    def check_and_update_genres(pg_conn: _connection, curs: DictCursor, es_connect: dict, state: State):
-        last_modified, postgres_extractor, es_loader = EtlProcess.init_process(pg_conn, curs, es_connect, state)
-        while True:
-            data = postgres_extractor.extract_genre_data(last_modified)
-            if data:
-                transformed_data = [parse_genres_postgres_to_es(_) for _ in data]
-                es_loader.send_genres_data(es_loader.es, transformed_data)
+                yield transformed_filmwork_data, {f"{model_name}_cursor": postgres_extractor.cursor}
 
-                postgres_extractor.offset += len(data)
-                state.set_state("offset", postgres_extractor.offset)
-                state.set_state('last_modified', datetime.now().strftime('%Y-%m-%d'))
-            else:
-                postgres_extractor.offset = 0
-                state.set_state("offset", 0)
-                break
\ No newline at end of file
+        for number, model_name in enumerate(model_names, 1):
+            postgres_extractor.cursor = state.get_state(f"{model_name}_cursor")
+            track = number < len(model_names)
+            es_loader.load_batches(index, batches(model_name, track), EtlProcess.commit_state(state))
+
+    def check_and_update_persons(
+        pg_conn: _connection, curs: DictCursor, es_loader: ESLoad, state: State, index: str = 'persons'
+    ):
+        postgres_extractor = EtlProcess.init_process(pg_conn, curs, state)
+        validate = EtlSettings().validate_documents
+        batches = (
+            (
+                transform_persons(data, validate),
+                {"cursor": postgres_extractor.cursor},
+            )
+            for data in postgres_extractor.person_batches()
+        )
+        es_loader.load_batches(index, batches, EtlProcess.commit_state(state))
+
+    def check_and_update_genres(
+        pg_conn: _connection, curs: DictCursor, es_loader: ESLoad, state: State, index: str = 'genres'
+    ):
+        postgres_extractor = EtlProcess.init_process(pg_conn, curs, state)
+        validate = EtlSettings().validate_documents
+        batches = (
+            (
+                transform_genres(data, validate),
+                {"cursor": postgres_extractor.cursor},
+            )
+            for data in postgres_extractor.genre_batches()
+        )
+        es_loader.load_batches(index, batches, EtlProcess.commit_state(state))
+
+    def update_by_ids(pg_conn: _connection, curs: DictCursor, es_loader: ESLoad, changes: Dict[str, List[str]]):
+        """
+        Переиндексация по id из уведомлений Postgres: фильмы (включая затронутые изменениями персон и жанров),
+        персоны и жанры
+        """
+        postgres_extractor = PSExtract(pg_conn, curs, None)
+        validate = EtlSettings().validate_documents
+        filmwork_ids = []
+        for model_name in EtlProcess.MODEL_NAMES:
+            if changes.get(model_name):
+                filmwork_ids.extend(postgres_extractor.extract_filmwork_ids(model_name, changes[model_name]))
+        filmwork_ids = list(dict.fromkeys(filmwork_ids))
+
+        if filmwork_ids:
+            es_data = EtlProcess.build_filmworks(postgres_extractor, filmwork_ids)
+            es_loader.load_batches('movies', [(es_data, None)], lambda checkpoint: None)
+        if changes.get('person'):
+            data = postgres_extractor.extract_person_data(changes['person'])
+            es_data = transform_persons(data, validate)
+            es_loader.load_batches('persons', [(es_data, None)], lambda checkpoint: None)
+        if changes.get('genre'):
+            data = postgres_extractor.extract_genre_data(changes['genre'])
+            es_data = transform_genres(data, validate)
+            es_loader.load_batches('genres', [(es_data, None)], lambda checkpoint: None)
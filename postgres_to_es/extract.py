@@ -1,19 +1,51 @@
+import uuid
+from typing import Iterator, List, Optional, Tuple
 from psycopg2.extensions import connection as _connection
 from psycopg2.extras import DictCursor
 from backoff import backoff
+from stats import stats
 
 
 class PSExtract:
     LIMIT_ROWS = 100
+    MIN_MODIFIED = '1970-01-01'
+    MIN_ID = '00000000-0000-0000-0000-000000000000'
+    PERSON_FIELDS = 'p.id, p.full_name as name, p.modified'
+    GENRE_FIELDS = 'g.id, g.name as genre, g.description, g.modified'
+    FILMWORK_DATA_QUERY = (
+        "SELECT fw.id as fw_id, fw.title, fw.description, fw.rating, "
+        "COALESCE(jsonb_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) "
+        "FILTER (WHERE pfw.role = 'actor' and p.id is not null), '[]') as actors, "
+        "COALESCE(jsonb_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name)) "
+        "FILTER (WHERE pfw.role = 'writer' and p.id is not null), '[]') as writers, "
+        "COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director'), '{}') as directors, "
+        "COALESCE(array_agg(DISTINCT g.name) FILTER (WHERE g.id is not null), '{}') as genres "
+        "FROM content.film_work fw "
+        "LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id "
+        "LEFT JOIN content.person p ON p.id = pfw.person_id "
+        "LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id "
+        "LEFT JOIN content.genre g ON g.id = gfw.genre_id "
+        "WHERE fw.id = ANY(%(ids)s::uuid[]) "
+        "GROUP BY fw.id"
+    )
 
-    def __init__(self, pg_conn: _connection, curs: DictCursor, offset: int) -> None:
+    def __init__(
+        self,
+        pg_conn: _connection,
+        curs: DictCursor,
+        cursor: Optional[Tuple[str, str]],
+        stream: bool = False,
+        lag: float = 0,
+    ) -> None:
         self.pg_conn = pg_conn
         self.curs = curs
-        self.offset = offset
+        self.cursor = cursor
+        self.stream = stream
+        self.lag = lag
 
     @staticmethod
     @backoff()
-    def extract_data(query: str, curs: DictCursor):
+    def extract_data(query: str, curs: DictCursor, params: Optional[dict] = None):
         """
         Метод загрузки данных из Postgres
 
@@ -21,70 +53,155 @@ class PSExtract:
         ----------
         :param query: запрос к БД
         :param curs: курсор Postgres
+        :param params: параметры запроса
         ----------
         """
-        curs.execute(query)
-        data = curs.fetchall()
+        with stats.timer('extract'):
+            curs.execute(query, params)
+            data = curs.fetchall()
+        stats.count('extract', 'rows', len(data))
         return data
 
-    def extract_filmwork_data(self, last_modified: str, model_name: str) -> list:
+    def stream_data(self, query: str, id_field: str = 'id') -> Iterator[list]:
+        """
+        Метод потоковой загрузки данных из Postgres: один серверный (именованный) курсор
+        на весь проход, данные отдаются пачками по LIMIT_ROWS через fetchmany
+
+        Parameters
+        ----------
+        :param query: запрос к БД без LIMIT
+        :param id_field: поле id для keyset-курсора
+        ----------
+        """
+        with self.pg_conn.cursor(name=f'etl_{uuid.uuid4().hex}', cursor_factory=DictCursor) as curs:
+            curs.itersize = self.LIMIT_ROWS
+            with stats.timer('extract'):
+                curs.execute(query, self.cursor_params())
+            while True:
+                with stats.timer('extract'):
+                    data = curs.fetchmany(self.LIMIT_ROWS)
+                stats.count('extract', 'rows', len(data))
+                self.move_cursor(data, id_field)
+                if not data:
+                    break
+                yield data
+        self.pg_conn.commit()
+
+    def batches(self, query: str, id_field: str = 'id') -> Iterator[list]:
+        """
+        Пачки данных для запроса с keyset-курсором: в потоковом режиме одним серверным курсором,
+        иначе отдельным запросом с LIMIT на каждую пачку
+        """
+        if self.stream:
+            yield from self.stream_data(query, id_field)
+            return
+        query = f"{query}LIMIT %(limit)s;"
+        while True:
+            data = self.extract_data(query, self.curs, self.cursor_params())
+            self.move_cursor(data, id_field)
+            if not data:
+                break
+            yield data
+
+    def cursor_params(self) -> dict:
+        """
+        Параметры keyset-курсора (modified, id): продолжаем с последней выгруженной строки.
+        Строки моложе lag секунд не читаются, чтобы не пропустить еще не закоммиченные транзакции
+        """
+        cursor_modified, cursor_id = self.cursor or (self.MIN_MODIFIED, self.MIN_ID)
+        return {
+            'cursor_modified': cursor_modified,
+            'cursor_id': cursor_id,
+            'lag': self.lag,
+            'limit': self.LIMIT_ROWS,
+        }
+
+    def watermark(self) -> str:
+        """
+        Граница выгрузки по часам Postgres (now() - lag, как в keyset-запросах): строки не новее нее
+        попадают в проход, начатый сейчас
+        """
+        query = "SELECT now() - make_interval(secs => %(lag)s) as watermark;"
+        return self.extract_data(query, self.curs, {'lag': self.lag})[0]['watermark'].isoformat()
+
+    def move_cursor(self, data: list, id_field: str = 'id') -> None:
+        if data:
+            self.cursor = (data[-1]['modified'].isoformat(), str(data[-1][id_field]))
+
+    def changed_batches(self, model_name: str) -> Iterator[list]:
+        """
+        Producer: пачки id измененных записей таблицы model_name (film_work, person или genre)
+        """
+        query = (
+            "SELECT t.id, t.modified "
+            f"FROM content.{model_name} t "
+            "WHERE (t.modified, t.id) > (%(cursor_modified)s, %(cursor_id)s::uuid) "
+            "AND t.modified <= now() - make_interval(secs => %(lag)s) "
+            "ORDER BY t.modified, t.id "
+        )
+        return self.batches(query)
+
+    def extract_filmwork_ids(self, model_name: str, ids: List[str]) -> List[str]:
+        """
+        Enricher: id кинопроизведений, затронутых изменениями записей model_name
+        """
         if model_name == 'film_work':
-            where = f"WHERE fw.modified > '{last_modified}' "
-        elif model_name == 'person':
-            where = f"WHERE p.modified > '{last_modified}' "
-        elif model_name == 'genre':
-            where = f"WHERE g.modified > '{last_modified}' "
+            return ids
         query = (
-            "SELECT fw.id as fw_id, fw.title, fw.description, "
-            "fw.rating, fw.type, fw.created, fw.modified, "
-            "COALESCE ( \
-                json_agg( \
-                    DISTINCT jsonb_build_object( \
-                        'person_id', p.id, \
-                        'role', pfw.role, \
-                        'full_name', p.full_name \
-                    ) \
-                ) FILTER (WHERE p.id is not null), \
-                '[]' \
-            ) as persons, "
-            "array_agg(DISTINCT g.name) as genres "
-            "FROM content.film_work fw "
-            "LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id "
-            "LEFT JOIN content.person p ON p.id = pfw.person_id "
-            "LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id "
-            "LEFT JOIN content.genre g ON g.id = gfw.genre_id "
-            f"{where}"
-            "GROUP BY fw.id "
-            "ORDER BY modified "
-            f"LIMIT {self.LIMIT_ROWS} OFFSET {self.offset};"
+            "SELECT DISTINCT film_work_id "
+            f"FROM content.{model_name}_film_work "
+            f"WHERE {model_name}_id = ANY(%(ids)s::uuid[]);"
         )
-        data = self.extract_data(query, self.curs)
+        data = self.extract_data(query, self.curs, {'ids': ids})
+        return [str(row['film_work_id']) for row in data]
 
-        return data
+    def extract_filmwork_data(self, ids: List[str]) -> list:
+        """
+        Merger: агрегированные данные кинопроизведений по списку id.
+        Персоны сразу разделены по ролям: actors и writers - массивы {id, name}, directors - массив имен
+        """
+        return self.extract_data(f"{self.FILMWORK_DATA_QUERY};", self.curs, {'ids': ids})
+
+    def extract_filmwork_documents(self, ids: List[str]) -> list:
+        """
+        Merger в режиме готовых документов: Postgres сам собирает _source индекса movies
+        и отдает его текстом JSON (строки id, source), который загружается без разбора в Python
+        """
+        query = (
+            "SELECT f.fw_id::text as id, jsonb_build_object("
+            "'id', f.fw_id, 'imdb_rating', f.rating, 'genre', to_jsonb(f.genres), "
+            "'title', f.title, 'description', f.description, 'director', to_jsonb(f.directors), "
+            "'actors_names', (SELECT COALESCE(jsonb_agg(a->'name'), '[]') FROM jsonb_array_elements(f.actors) a), "
+            "'writers_names', (SELECT COALESCE(jsonb_agg(w->'name'), '[]') FROM jsonb_array_elements(f.writers) w), "
+            "'actors', f.actors, 'writers', f.writers"
+            f")::text as source FROM ({self.FILMWORK_DATA_QUERY}) f;"
+        )
+        return self.extract_data(query, self.curs, {'ids': ids})
 
-    def extract_person_data(self, last_modified: str) -> list:
-        where = f"WHERE p.modified > '{last_modified}' "
+    def person_batches(self) -> Iterator[list]:
         query = (
-            "SELECT p.id , p.full_name as name "
+            f"SELECT {self.PERSON_FIELDS} "
             "FROM content.person p "
-            f"{where}"
-            "GROUP BY p.id "
-            "ORDER BY modified "
-            f"LIMIT {self.LIMIT_ROWS} OFFSET {self.offset};"
+            "WHERE (p.modified, p.id) > (%(cursor_modified)s, %(cursor_id)s::uuid) "
+            "AND p.modified <= now() - make_interval(secs => %(lag)s) "
+            "ORDER BY p.modified, p.id "
         )
-        data = self.extract_data(query, self.curs)
-        return data
+        return self.batches(query)
+
+    def extract_person_data(self, ids: List[str]) -> list:
+        query = f"SELECT {self.PERSON_FIELDS} FROM content.person p WHERE p.id = ANY(%(ids)s::uuid[]);"
+        return self.extract_data(query, self.curs, {'ids': ids})
 
-    def extract_genre_data(self, last_modified: str) -> list:
-        where = f"WHERE g.modified > '{last_modified}' "
+    def genre_batches(self) -> Iterator[list]:
         query = (
-            "SELECT g.id, g.name as genre, g.description "
+            f"SELECT {self.GENRE_FIELDS} "
             "FROM content.genre g "
-            f"{where}"
-            "GROUP BY g.id "
-            "ORDER BY modified "
-            f"LIMIT {self.LIMIT_ROWS} OFFSET {self.offset};"
+            "WHERE (g.modified, g.id) > (%(cursor_modified)s, %(cursor_id)s::uuid) "
+            "AND g.modified <= now() - make_interval(secs => %(lag)s) "
+            "ORDER BY g.modified, g.id "
         )
-        data = self.extract_data(query, self.curs)
+        return self.batches(query)
 
-        return data
\ No newline at end of file
+    def extract_genre_data(self, ids: List[str]) -> list:
+        query = f"SELECT {self.GENRE_FIELDS} FROM content.genre g WHERE g.id = ANY(%(ids)s::uuid[]);"
+        return self.extract_data(query, self.curs, {'ids': ids})
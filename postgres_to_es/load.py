@@ -1,27 +1,292 @@
-from typing import List, Tuple
-from elasticsearch import Elasticsearch, helpers
-from p_schemas import ESFilmworkData, ESPersonData, ESGenreData
-from backoff import backoff
+import json
+import time
+from collections import deque
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from elasticsearch import Elasticsearch, NotFoundError, helpers
+from redis import Redis, RedisError
+from p_schemas import RawDocument
+from config import EtlSettings, RedisSettings
+from logger import logger
+from stats import stats
+
+Document = Union[dict, RawDocument]
+
+
+def document_id(data: Document) -> str:
+    return data.id if isinstance(data, RawDocument) else data['id']
+
+
+def bulk_action(index: str, data: Document) -> dict:
+    source = data.source if isinstance(data, RawDocument) else data
+    return {"_index": index, "_id": document_id(data), "_source": source}
+
+
+def expand_action(action: dict) -> Tuple[dict, Any]:
+    """
+    expand_action_callback для helpers bulk без копирования действия. Сериализатор клиента
+    не трогает строки, поэтому JSON-текст RawDocument уходит в тело _bulk как есть, без разбора
+    """
+    return {"index": {"_index": action["_index"], "_id": action["_id"]}}, action["_source"]
 
 
 class ESLoad:
-    def __init__(self, es_host: str, es_user: str, es_password: str):
-        self.es = Elasticsearch(es_host, basic_auth=(es_user, es_password), verify_certs=False)
-
-    @staticmethod
-    @backoff()
-    def send_data(es: Elasticsearch, es_data: List[ESFilmworkData]) -> Tuple[int, list]:
-        query = [{"_index": "movies", "_id": data.id, "_source": data.dict()} for data in es_data]
-        helpers.bulk(es, query)
-
-    @staticmethod
-    @backoff()
-    def send_persons_data(es: Elasticsearch, es_data: List[ESPersonData]) -> Tuple[int, list]:
-        query = [{"_index": "persons", "_id": data.id, "_source": data.dict()} for data in es_data]
-        helpers.bulk(es, query)
-
-    @staticmethod
-    @backoff()
-    def send_genres_data(es: Elasticsearch, es_data: List[ESGenreData]) -> Tuple[int, list]:
-        query = [{"_index": "genres", "_id": data.id, "_source": data.dict()} for data in es_data]
-        helpers.bulk(es, query)
\ No newline at end of file
+    RETRY_STATUSES = (429, 502, 503, 504)
+    COPIED_SETTINGS = ('number_of_shards', 'number_of_replicas', 'refresh_interval', 'analysis')
+    FORCEMERGE_TIMEOUT = 3600
+
+    def __init__(self, es_host: str, es_user: str, es_password: str, es: Optional[Elasticsearch] = None):
+        self.es = es or Elasticsearch(es_host, basic_auth=(es_user, es_password), verify_certs=False)
+        self.bulk_indices = set()
+        self.settings = EtlSettings()
+        if self.settings.stats_interval or self.settings.metrics_port:
+            self.track_bulk_requests()
+        self.redis_settings = RedisSettings()
+        self.redis = (
+            Redis(host=self.redis_settings.redis_host, port=self.redis_settings.redis_port)
+            if self.redis_settings.publish_changes
+            else None
+        )
+
+    def track_bulk_requests(self) -> None:
+        """
+        Учет запросов _bulk на уровне транспорта: время, размер тела и документы, в том числе
+        для helpers.parallel_bulk и повторных отправок. Тело не копируется: для строки размер
+        считается в символах (для ASCII это байты)
+        """
+        perform_request = self.es.transport.perform_request
+
+        def tracked(method, url, headers=None, params=None, body=None):
+            if not url.endswith('/_bulk'):
+                return perform_request(method, url, headers=headers, params=params, body=body)
+            with stats.timer('load'):
+                response = perform_request(method, url, headers=headers, params=params, body=body)
+            stats.count('load', 'bytes', len(body))
+            stats.count('load', 'docs', body.count(b'\n' if isinstance(body, bytes) else '\n') // 2)
+            return response
+
+        self.es.transport.perform_request = tracked
+
+    def publish_changes(self, index: str, ids: Optional[List[str]]) -> None:
+        """
+        Публикация id записанных документов, чтобы API сбросил их кэш. ids = None - изменился весь индекс.
+        version - монотонная метка события, из нее API получает новое поколение страниц индекса.
+        Загрузка в новую версию индекса при переиндексации не публикуется: API читает ее только через алиас,
+        который сбрасывается одним событием после swap_alias
+        """
+        if self.redis is None or ids == [] or index in self.bulk_indices:
+            return
+        try:
+            message = json.dumps({'index': index, 'ids': ids, 'version': time.time_ns()})
+            self.redis.publish(self.redis_settings.changes_channel, message)
+        except RedisError as error:
+            logger.error(f'Error publishing changes to Redis: {error}')
+
+    def send_data(self, es_data: List[Document], index: str = 'movies') -> None:
+        """
+        Последовательная загрузка пачки. Ошибки документов и соединения обрабатываются retry_failed,
+        как в parallel_load: если повторы исчерпаны, исключение доходит до вызывающего
+        и контрольная точка пачки не сохраняется
+        """
+        actions = [bulk_action(index, data) for data in es_data]
+        failed = [
+            (action, next(iter(item.values())))
+            for action, (ok, item) in zip(
+                actions,
+                helpers.streaming_bulk(
+                    self.es,
+                    actions,
+                    expand_action_callback=expand_action,
+                    chunk_size=self.settings.bulk_chunk_size,
+                    max_chunk_bytes=self.settings.bulk_max_chunk_bytes,
+                    raise_on_error=False,
+                    raise_on_exception=False,
+                ),
+            )
+            if not ok
+        ]
+        if failed:
+            self.retry_failed(failed)
+
+    def load_batches(
+        self, index: str, batches: Iterable[Tuple[List[Document], Any]], commit: Callable[[Any], None]
+    ) -> None:
+        """
+        Загрузка пачек документов в индекс. После того как пачка подтверждена Elasticsearch,
+        вызывается commit с ее контрольной точкой (например, состоянием курсора).
+        Контрольные точки сохраняются группами, см. flush_acknowledged
+
+        Parameters
+        ----------
+        :param index: индекс Elasticsearch
+        :param batches: пачки документов (словарей _source или RawDocument) вместе с контрольными точками
+        :param commit: функция сохранения контрольной точки
+        ----------
+        """
+        if self.settings.bulk_parallel:
+            self.parallel_load(index, batches, commit)
+            return
+        acknowledged = []
+        for es_data, checkpoint in batches:
+            self.send_data(es_data, index)
+            acknowledged.append((checkpoint, [document_id(data) for data in es_data]))
+            self.flush_acknowledged(index, acknowledged, commit)
+        self.flush_acknowledged(index, acknowledged, commit, force=True)
+
+    def flush_acknowledged(
+        self, index: str, acknowledged: List[Tuple[Any, List[str]]], commit: Callable[[Any], None], force: bool = False
+    ) -> None:
+        """
+        Подтвержденные Elasticsearch пачки копятся до bulk_chunk_size документов (или до конца загрузки),
+        затем индекс обновляется одним refresh, чтобы документы стали видны поиску, публикуется одно событие
+        сброса кэша API и по порядку сохраняются контрольные точки. Без публикации refresh не нужен:
+        событие не должно опережать refresh, иначе API закэширует старые результаты поиска
+        """
+        docs = sum(len(ids) for _, ids in acknowledged)
+        if not acknowledged or not force and docs < self.settings.bulk_chunk_size:
+            return
+        if docs and self.redis is not None and index not in self.bulk_indices:
+            self.es.indices.refresh(index=index)
+            self.publish_changes(index, [_ for _, ids in acknowledged for _ in ids])
+        for checkpoint, _ in acknowledged:
+            commit(checkpoint)
+        acknowledged.clear()
+
+    def parallel_load(
+        self, index: str, batches: Iterable[Tuple[List[Document], Any]], commit: Callable[[Any], None]
+    ) -> None:
+        """
+        Загрузка через helpers.parallel_bulk: пачки читаются из batches в потоке пула,
+        поэтому выборка из Postgres идет одновременно с записью в Elasticsearch.
+        Повторно отправляются только документы, по которым bulk вернул ошибку
+        """
+        checkpoints = deque()
+        in_flight = {}
+        acknowledged = []
+
+        def done() -> None:
+            _, checkpoint, ids = checkpoints.popleft()
+            acknowledged.append((checkpoint, ids))
+            self.flush_acknowledged(index, acknowledged, commit)
+
+        def actions() -> Iterator[dict]:
+            sent = 0
+            for es_data, checkpoint in batches:
+                sent += len(es_data)
+                checkpoints.append((sent, checkpoint, [document_id(data) for data in es_data]))
+                for data in es_data:
+                    action = bulk_action(index, data)
+                    in_flight[action["_id"]] = action
+                    yield action
+
+        acked = 0
+        failed = []
+        for ok, item in helpers.parallel_bulk(
+            self.es,
+            actions(),
+            expand_action_callback=expand_action,
+            thread_count=self.settings.bulk_thread_count,
+            chunk_size=self.settings.bulk_chunk_size,
+            max_chunk_bytes=self.settings.bulk_max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ):
+            acked += 1
+            result = next(iter(item.values()))
+            action = in_flight.pop(result.get('_id'), None)
+            if not ok:
+                failed.append((action, result))
+            while checkpoints and checkpoints[0][0] <= acked:
+                if failed:
+                    self.retry_failed(failed)
+                    failed = []
+                done()
+        if failed:
+            self.retry_failed(failed)
+        while checkpoints:
+            done()
+        self.flush_acknowledged(index, acknowledged, commit, force=True)
+
+    def retry_failed(self, failed: List[Tuple[dict, dict]]) -> None:
+        """
+        Повторная отправка документов по ответам bulk: ошибки 429/5xx и ошибки соединения повторяются
+        с экспоненциальной задержкой, остальные ошибки документов логируются.
+        Если повторы исчерпаны, поднимается BulkIndexError, чтобы контрольная точка не была сохранена
+        """
+        sleep_time = 0.1
+        for attempt in range(self.settings.bulk_max_retries + 1):
+            retry = []
+            for action, result in failed:
+                if action is not None and (result.get('status') in self.RETRY_STATUSES or 'exception' in result):
+                    retry.append(action)
+                else:
+                    logger.error(f"Error indexing document {result.get('_id')}: {result.get('error')}")
+            if not retry:
+                return
+            if attempt == self.settings.bulk_max_retries:
+                raise helpers.BulkIndexError(f"{len(retry)} document(s) failed to index after retries", failed)
+            stats.count('load', 'retries', len(retry))
+            time.sleep(sleep_time)
+            sleep_time *= 2
+            failed = [
+                (action, next(iter(item.values())))
+                for action, (ok, item) in zip(
+                    retry,
+                    helpers.streaming_bulk(
+                        self.es,
+                        retry,
+                        expand_action_callback=expand_action,
+                        chunk_size=self.settings.bulk_chunk_size,
+                        max_chunk_bytes=self.settings.bulk_max_chunk_bytes,
+                        raise_on_error=False,
+                        raise_on_exception=False,
+                        ),
+                )
+                if not ok
+            ]
+
+    def index_body(self, alias: str) -> dict:
+        """
+        Настройки и маппинг текущего индекса (или индекса за алиасом) для создания его новой версии
+        """
+        current = next(iter(self.es.indices.get(index=alias).values()))
+        settings = {
+            key: value for key, value in current['settings']['index'].items() if key in self.COPIED_SETTINGS
+        }
+        return {'settings': settings, 'mappings': current['mappings']}
+
+    def create_bulk_index(self, index: str, body: dict) -> None:
+        """
+        Создание индекса для массовой загрузки: без обновления (refresh) и без реплик
+        """
+        settings = {**body['settings'], 'refresh_interval': '-1', 'number_of_replicas': 0}
+        self.es.indices.create(index=index, body={**body, 'settings': settings})
+        self.bulk_indices.add(index)
+
+    def finish_bulk_index(self, index: str, settings: dict) -> None:
+        """
+        Возврат настроек refresh_interval и number_of_replicas после загрузки и слияние сегментов
+        """
+        self.es.indices.put_settings(
+            index=index,
+            body={
+                'index': {
+                    'refresh_interval': settings.get('refresh_interval', '1s'),
+                    'number_of_replicas': settings.get('number_of_replicas', 1),
+                }
+            },
+        )
+        self.es.indices.forcemerge(index=index, max_num_segments=1, request_timeout=self.FORCEMERGE_TIMEOUT)
+        self.es.indices.refresh(index=index)
+
+    def swap_alias(self, alias: str, index: str) -> None:
+        """
+        Атомарное переключение алиаса на новый индекс с удалением предыдущих версий
+        """
+        try:
+            old_indices = list(self.es.indices.get(index=alias))
+        except NotFoundError:
+            old_indices = []
+        actions = [{'remove_index': {'index': old_index}} for old_index in old_indices]
+        actions.append({'add': {'index': index, 'alias': alias}})
+        self.es.indices.update_aliases(body={'actions': actions})
+        self.bulk_indices.discard(index)
@@ -5,3 +5,4 @@ logging.basicConfig(
     filename="log.txt",
 )
 logger = logging.getLogger("loader")
+logger.setLevel(logging.INFO)
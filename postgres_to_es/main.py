@@ -1,53 +1,91 @@
+import argparse
 import time
-from contextlib import closing
-import psycopg2
-from psycopg2.extras import DictCursor
+from functools import partial
 from dotenv import load_dotenv
-from state import JsonFileStorage, State
+from state import MemoryStorage, State
 from etl_process import EtlProcess
+from extract import PSExtract
+from runtime import EtlRuntime
+from notify import install_triggers
 from logger import logger
-from config import DbSettings, ElasticSettings
+from config import DbSettings, ElasticSettings, EtlSettings
 
 load_dotenv()
 
 
-def main(ps_connect: dict, es_connect: dict):
-    """
-    Функция запуска внутренних компонентов ETL
-    """
-    while True:
-        try:
-            with closing(
-                psycopg2.connect(**ps_connect, cursor_factory=DictCursor)
-            ) as pg_conn, pg_conn.cursor() as curs:
-                storage = JsonFileStorage('state.json')
-                state = State(storage)
+REBUILD_PROCESSES = {
+    'movies': (
+        partial(EtlProcess.check_and_update, model_names=['film_work']),
+        'state',
+        [f'{model_name}_cursor' for model_name in EtlProcess.MODEL_NAMES],
+    ),
+    'persons': (EtlProcess.check_and_update_persons, 'state_persons', ['cursor']),
+    'genres': (EtlProcess.check_and_update_genres, 'state_genres', ['cursor']),
+}
 
-                EtlProcess.check_and_update(pg_conn, curs, es_connect, state)
 
-            with closing(
-                psycopg2.connect(**ps_connect, cursor_factory=DictCursor)
-            ) as pg_conn, pg_conn.cursor() as curs:
-                storage = JsonFileStorage('state_persons.json')
-                state = State(storage)
+def rebuild(runtime: EtlRuntime):
+    """
+    Полная переиндексация: для каждого алиаса создается новая версия индекса без refresh и реплик,
+    после загрузки настройки возвращаются, сегменты сливаются и алиас атомарно переключается.
+    Инкрементальное состояние сдвигается на границу выгрузки по часам Postgres, взятую до начала прохода
+    """
+    es_loader = runtime.es_loader
+    for alias, (process, state_name, cursor_keys) in REBUILD_PROCESSES.items():
+        with runtime.connection() as pg_conn, pg_conn.cursor() as curs:
+            started = PSExtract(pg_conn, curs, None, lag=runtime.settings.watermark_lag).watermark()
+        index = f'{alias}_{int(time.time())}'
+        body = es_loader.index_body(alias)
+        es_loader.create_bulk_index(index, body)
+        logger.info(f'Rebuilding {alias} into {index}')
 
-                EtlProcess.check_and_update_persons(pg_conn, curs, es_connect, state)
+        runtime.run_process(partial(process, index=index), State(MemoryStorage()))
 
-            with closing(
-                psycopg2.connect(**ps_connect, cursor_factory=DictCursor)
-            ) as pg_conn, pg_conn.cursor() as curs:
-                storage = JsonFileStorage('state_genres.json')
-                state = State(storage)
+        es_loader.finish_bulk_index(index, body['settings'])
+        es_loader.swap_alias(alias, index)
+        es_loader.publish_changes(alias, None)
 
-                EtlProcess.check_and_update_genres(pg_conn, curs, es_connect, state)
+        state = State(runtime.storage(state_name))
+        state.set_states({key: (started, PSExtract.MIN_ID) for key in cursor_keys})
+        logger.info(f'Alias {alias} switched to {index}')
 
-        except psycopg2.OperationalError:
-            logger.error('Error connecting to Postgres database')
 
-        time.sleep(1)
+def main(runtime: EtlRuntime, settings: EtlSettings):
+    """
+    Функция запуска внутренних компонентов ETL: процессы фильмов, персон и жанров
+    работают параллельно, каждый со своим интервалом. В режиме уведомлений изменения
+    приходят через LISTEN/NOTIFY, а периодический опрос остается страховочным
+    """
+    if settings.notify:
+        runtime.listen(EtlProcess.update_by_ids, settings.notify_batch_window, settings.notify_batch_size)
+        movies_interval = persons_interval = genres_interval = settings.sweep_interval
+    else:
+        movies_interval, persons_interval, genres_interval = (
+            settings.movies_interval,
+            settings.persons_interval,
+            settings.genres_interval,
+        )
+    runtime.schedule('movies', EtlProcess.check_and_update, 'state', movies_interval)
+    runtime.schedule('persons', EtlProcess.check_and_update_persons, 'state_persons', persons_interval)
+    runtime.schedule('genres', EtlProcess.check_and_update_genres, 'state_genres', genres_interval)
+    runtime.join()
 
 
 if __name__ == '__main__':
-    ps_connect = DbSettings().dict()
-    es_connect = ElasticSettings().dict()
-    main(ps_connect, es_connect)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rebuild', action='store_true', help='полная переиндексация с переключением алиасов')
+    parser.add_argument(
+        '--install-triggers', action='store_true', help='установить триггеры уведомлений для ETL_NOTIFY и выйти'
+    )
+    args = parser.parse_args()
+
+    settings = EtlSettings()
+    runtime = EtlRuntime(DbSettings().dict(), ElasticSettings().dict(), settings)
+    if args.install_triggers:
+        with runtime.connection() as pg_conn:
+            install_triggers(pg_conn)
+        logger.info('Notify triggers installed')
+        raise SystemExit
+    if args.rebuild:
+        rebuild(runtime)
+    main(runtime, settings)
@@ -0,0 +1,100 @@
+import json
+import select
+import time
+from collections import defaultdict
+from typing import Dict, List
+from psycopg2.extensions import connection as _connection
+from logger import logger
+
+CHANNEL = 'etl_changes'
+NOTIFY_TABLES = ['film_work', 'person', 'genre', 'person_film_work', 'genre_film_work']
+
+# Для таблиц связей в уведомлении передается id кинопроизведения
+NOTIFY_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION content.etl_notify() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    IF row_data ? 'film_work_id' THEN
+        PERFORM pg_notify('{CHANNEL}', json_build_object('table', 'film_work', 'id', row_data->>'film_work_id')::text);
+    ELSE
+        PERFORM pg_notify('{CHANNEL}', json_build_object('table', TG_TABLE_NAME, 'id', row_data->>'id')::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+NOTIFY_TRIGGER = """
+DROP TRIGGER IF EXISTS etl_notify ON content.{table};
+CREATE TRIGGER etl_notify AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+    FOR EACH ROW EXECUTE FUNCTION content.etl_notify();
+"""
+
+
+def install_triggers(pg_conn: _connection) -> None:
+    """
+    Однократная установка функции и триггеров уведомлений (main.py --install-triggers).
+    DDL берет ACCESS EXCLUSIVE блокировки таблиц и требует прав владельца, поэтому слушатель ее не выполняет
+    """
+    with pg_conn.cursor() as curs:
+        curs.execute(NOTIFY_FUNCTION)
+        for table in NOTIFY_TABLES:
+            curs.execute(NOTIFY_TRIGGER.format(table=table))
+    pg_conn.commit()
+
+
+class ChangeListener:
+    """
+    Получение id измененных записей через LISTEN/NOTIFY и группировка их в микропачки
+    """
+
+    def __init__(self, pg_conn: _connection, batch_window: float, batch_size: int) -> None:
+        self.pg_conn = pg_conn
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+
+    def listen(self) -> None:
+        """
+        Подписка на канал уведомлений. Триггеры ставятся отдельно через install_triggers
+        """
+        self.pg_conn.autocommit = True
+        with self.pg_conn.cursor() as curs:
+            curs.execute("SELECT count(*) FROM pg_trigger WHERE tgname = 'etl_notify';")
+            if curs.fetchone()[0] < len(NOTIFY_TABLES):
+                logger.warning('listener: notify triggers are not installed, run main.py --install-triggers')
+            curs.execute(f'LISTEN {CHANNEL};')
+
+    def wait(self, timeout: float) -> bool:
+        if self.pg_conn.notifies:
+            return True
+        if select.select([self.pg_conn], [], [], timeout) == ([], [], []):
+            return False
+        self.pg_conn.poll()
+        return bool(self.pg_conn.notifies)
+
+    def changes(self, timeout: float) -> Dict[str, List[str]]:
+        """
+        Микропачка изменений: ждем первое уведомление не дольше timeout секунд,
+        затем собираем уведомления в течение batch_window секунд или до batch_size id
+        """
+        changes = defaultdict(dict)
+        if not self.wait(timeout):
+            return {}
+        deadline = time.monotonic() + self.batch_window
+        count = 0
+        while count < self.batch_size:
+            while self.pg_conn.notifies and count < self.batch_size:
+                payload = json.loads(self.pg_conn.notifies.pop(0).payload)
+                if payload['id'] not in changes[payload['table']]:
+                    changes[payload['table']][payload['id']] = None
+                    count += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.wait(remaining):
+                break
+        return {table: list(ids) for table, ids in changes.items()}
@@ -1,26 +1,7 @@
-from datetime import datetime
-from typing import Optional, List
+from typing import NamedTuple, Optional, List
 from pydantic import BaseModel
 
 
-class Person(BaseModel):
-    person_id: str
-    role: str
-    full_name: str
-
-
-class FilmworkData(BaseModel):
-    fw_id: str
-    title: str
-    description: Optional[str]
-    rating: Optional[float]
-    type: str
-    created: datetime
-    modified: datetime
-    persons: Optional[List[Person]]
-    genres: Optional[List[str]]
-
-
 class ESGenreData(BaseModel):
     id: str
     genre: str
@@ -41,3 +22,9 @@ class ESFilmworkData(BaseModel):
     writers_names: List[str]
     actors: List[ESPersonData]
     writers: List[ESPersonData]
+
+
+class RawDocument(NamedTuple):
+    """Документ, собранный в Postgres: source - готовый JSON-текст _source"""
+    id: str
+    source: str
@@ -0,0 +1,130 @@
+import threading
+from contextlib import closing, contextmanager
+from typing import Callable, Iterator
+import psycopg2
+import psycopg2.errors
+from psycopg2.extensions import connection as _connection
+from psycopg2.extras import DictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from elasticsearch.helpers import BulkIndexError
+from state import BaseStorage, State, get_storage
+from config import EtlSettings
+from load import ESLoad
+from logger import logger
+from notify import ChangeListener
+from stats import stats
+
+
+class EtlRuntime:
+    """
+    Долгоживущая среда выполнения ETL: общий пул соединений с Postgres и один клиент Elasticsearch.
+    Каждый процесс (фильмы, персоны, жанры) работает в своем потоке со своим расписанием
+    """
+
+    def __init__(self, ps_connect: dict, es_connect: dict, settings: EtlSettings):
+        self.ps_connect = ps_connect
+        self.settings = settings
+        self.pool = ThreadedConnectionPool(0, settings.pg_pool_size, **ps_connect, cursor_factory=DictCursor)
+        self.es_loader = ESLoad(**es_connect)
+        self.stopped = threading.Event()
+        self.threads = []
+        if settings.metrics_port:
+            stats.serve(settings.metrics_port)
+        if settings.stats_interval:
+            self.report_stats(settings.stats_interval)
+
+    @contextmanager
+    def connection(self) -> Iterator[_connection]:
+        """
+        Соединение из пула; после ошибки соединение закрывается, а не возвращается в пул
+        """
+        pg_conn = self.pool.getconn()
+        try:
+            yield pg_conn
+        except Exception:
+            self.pool.putconn(pg_conn, close=True)
+            raise
+        if not pg_conn.closed:
+            pg_conn.rollback()
+        self.pool.putconn(pg_conn, close=bool(pg_conn.closed))
+
+    def storage(self, name: str) -> BaseStorage:
+        return get_storage(name, self.settings.state_backend, self.settings.state_sqlite_path)
+
+    def run_process(self, process: Callable, state: State) -> None:
+        with self.connection() as pg_conn, pg_conn.cursor() as curs:
+            process(pg_conn, curs, self.es_loader, state)
+
+    def schedule(self, name: str, process: Callable, state_name: str, interval: float) -> None:
+        """
+        Запуск процесса в отдельном потоке с паузой interval секунд между проходами
+        """
+
+        def loop():
+            state = State(self.storage(state_name))
+            while not self.stopped.is_set():
+                try:
+                    self.run_process(process, state)
+                except psycopg2.OperationalError:
+                    logger.error(f'{name}: error connecting to Postgres database')
+                except BulkIndexError as error:
+                    logger.error(f'{name}: error loading data to Elasticsearch: {error}')
+                except Exception:
+                    logger.exception(f'{name}: unexpected error')
+                self.stopped.wait(interval)
+
+        thread = threading.Thread(target=loop, name=name, daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def listen(self, process: Callable, batch_window: float, batch_size: int) -> None:
+        """
+        Запуск потока, который слушает уведомления Postgres об изменениях
+        и переиндексирует измененные записи микропачками
+        """
+
+        def loop():
+            while not self.stopped.is_set():
+                try:
+                    with closing(psycopg2.connect(**self.ps_connect)) as listen_conn:
+                        listener = ChangeListener(listen_conn, batch_window, batch_size)
+                        listener.listen()
+                        while not self.stopped.is_set():
+                            changes = listener.changes(timeout=1)
+                            if changes:
+                                with self.connection() as pg_conn, pg_conn.cursor() as curs:
+                                    process(pg_conn, curs, self.es_loader, changes)
+                except psycopg2.OperationalError:
+                    logger.error('listener: error connecting to Postgres database')
+                except psycopg2.errors.UndefinedTable:
+                    logger.error('listener: content tables are not created yet')
+                except BulkIndexError as error:
+                    logger.error(f'listener: error loading data to Elasticsearch: {error}')
+                except Exception:
+                    logger.exception('listener: unexpected error')
+                self.stopped.wait(1)
+
+        thread = threading.Thread(target=loop, name='listener', daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def report_stats(self, interval: float) -> None:
+        """
+        Периодическая строка лога со счетчиками стадий: строки из Postgres, документы и байты в Elasticsearch,
+        повторы и доля времени в каждой стадии
+        """
+
+        def loop():
+            while not self.stopped.wait(interval):
+                logger.info(stats.report())
+
+        threading.Thread(target=loop, name='stats', daemon=True).start()
+
+    def join(self) -> None:
+        for thread in self.threads:
+            thread.join()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+        self.pool.closeall()
@@ -1,5 +1,8 @@
 import abc
 import json
+import os
+import sqlite3
+import tempfile
 from typing import Any, Optional
 
 
@@ -18,21 +21,71 @@ class BaseStorage:
 class JsonFileStorage(BaseStorage):
     def __init__(self, file_path: Optional[str] = None):
         self.file_path = file_path
+        self.data = None
 
     def save_state(self, state: dict) -> None:
-        data = self.retrieve_state()
-        data.update(state)
-        with open(self.file_path, "w") as file:
-            json.dump(data, file)
+        """Атомарная запись: состояние пишется во временный файл, который затем переименовывается"""
+        data = {**self.retrieve_state(), **state}
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.state_')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(data, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.data = data
 
     def retrieve_state(self) -> dict:
-        try:
-            with open(self.file_path) as file:
-                data = json.load(file)
-                return data
-        except (FileNotFoundError, json.decoder.JSONDecodeError):
-            with open(self.file_path, 'w') as _:
-                return {}
+        if self.data is None:
+            try:
+                with open(self.file_path) as file:
+                    self.data = json.load(file)
+            except (FileNotFoundError, json.decoder.JSONDecodeError):
+                self.data = {}
+        return dict(self.data)
+
+
+class SqliteStorage(BaseStorage):
+    def __init__(self, db_path: str, namespace: str):
+        self.namespace = namespace
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS state (namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key))'
+            )
+
+    def save_state(self, state: dict) -> None:
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)',
+                [(self.namespace, key, json.dumps(value)) for key, value in state.items()],
+            )
+
+    def retrieve_state(self) -> dict:
+        rows = self.conn.execute('SELECT key, value FROM state WHERE namespace = ?', (self.namespace,))
+        return {key: json.loads(value) for key, value in rows}
+
+
+class MemoryStorage(BaseStorage):
+    def __init__(self):
+        self.data = {}
+
+    def save_state(self, state: dict) -> None:
+        self.data.update(state)
+
+    def retrieve_state(self) -> dict:
+        return dict(self.data)
+
+
+def get_storage(name: str, backend: str = 'json', sqlite_path: str = 'state.db') -> BaseStorage:
+    """Хранилище состояния процесса name: json-файл {name}.json или общая база SQLite"""
+    if backend == 'sqlite':
+        return SqliteStorage(sqlite_path, name)
+    return JsonFileStorage(f'{name}.json')
 
 
 class State:
@@ -42,6 +95,10 @@ class State:
     def set_state(self, key: str, value: Any) -> None:
         self.storage.save_state({key: value})
 
+    def set_states(self, values: dict) -> None:
+        """Сохранить несколько ключей одной записью"""
+        self.storage.save_state(values)
+
     def get_state(self, key: str) -> Any:
         data = self.storage.retrieve_state()
         return data.get(key)
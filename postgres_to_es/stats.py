@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, Tuple
+
+
+class EtlStats:
+    """
+    Счетчики и таймеры стадий ETL (extract, transform, load), общие для всех потоков.
+    Время стадии - сумма длительностей вызовов, поэтому при параллельной загрузке
+    оно может превышать время по часам
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.last_report: Dict[Tuple[str, str], float] = {}
+        self.last_report_at = time.monotonic()
+
+    def count(self, stage: str, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[(stage, name)] += value
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.counters[(stage, 'seconds')] += elapsed
+                self.counters[(stage, 'calls')] += 1
+
+    def timed(self, stage: str, counter: str = '') -> Callable:
+        """Декоратор: время вызова в стадии stage и, если задан counter, число вызовов под этим именем"""
+
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    result = func(*args, **kwargs)
+                if counter:
+                    self.count(stage, counter)
+                return result
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self) -> Dict[Tuple[str, str], float]:
+        with self.lock:
+            return dict(self.counters)
+
+    def report(self) -> str:
+        """Строка лога: значения счетчиков и их скорость с предыдущего отчета"""
+        now = time.monotonic()
+        current = self.snapshot()
+        interval = max(now - self.last_report_at, 1e-9)
+        parts = []
+        for (stage, name), value in sorted(current.items()):
+            delta = value - self.last_report.get((stage, name), 0)
+            if name == 'seconds':
+                parts.append(f'{stage}.{name}={delta:.2f} ({delta / interval:.0%} busy)')
+            elif name != 'calls':
+                parts.append(f'{stage}.{name}={delta:.0f} ({delta / interval:.1f}/s)')
+        self.last_report, self.last_report_at = current, now
+        return f'ETL stats for {interval:.0f}s: ' + ', '.join(parts)
+
+    def prometheus(self) -> str:
+        """Счетчики в текстовом формате Prometheus"""
+        lines = []
+        for (stage, name), value in sorted(self.snapshot().items()):
+            lines.append(f'etl_{name}_total{{stage="{stage}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        """HTTP-сервер метрик (любой путь отдает счетчики) в фоновом потоке"""
+        stats = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = stats.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('', port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        return server
+
+
+stats = EtlStats()
@@ -1,37 +1,79 @@
-from p_schemas import ESFilmworkData, FilmworkData, ESPersonData, ESGenreData
-
-
-def parse_from_postgres_to_es(data: dict):
-    film_data = FilmworkData.parse_obj(data)
-    actors = {}
-    writers = {}
-    directors = {}
-    for person in film_data.persons:
-        if person.role == "actor" and person.person_id not in actors:
-            actors[person.person_id] = person.full_name
-        elif person.role == "writer" and person.person_id not in writers:
-            writers[person.person_id] = person.full_name
-        elif person.role == "director" and person.person_id not in directors:
-            directors[person.person_id] = person.full_name
-
-    es_data = ESFilmworkData(
-        id=film_data.fw_id,
-        imdb_rating=film_data.rating,
-        genre=film_data.genres,
-        title=film_data.title,
-        description=film_data.description,
-        director=list(directors.values()),
-        actors_names=list(actors.values()),
-        writers_names=list(writers.values()),
-        actors=[{"id": id, "name": full_name} for id, full_name in actors.items()],
-        writers=[{"id": id, "name": full_name} for id, full_name in actors.items()],
-    )
-    return es_data
-
-def parse_persons_postgres_to_es(data:dict):
-    person_data = ESPersonData.parse_obj(data)
-    return person_data
-
-def parse_genres_postgres_to_es(data:dict):
-    genre_data = ESGenreData.parse_obj(data)
-    return genre_data
\ No newline at end of file
+import json
+from typing import Iterable, List, Type
+from pydantic import BaseModel
+from p_schemas import ESFilmworkData, ESPersonData, ESGenreData, RawDocument
+from stats import stats
+
+
+def validate_documents(docs: List[dict], model: Type[BaseModel]) -> List[dict]:
+    """
+    Отладочная проверка готовых документов схемой индекса: при ошибке поднимается ValidationError,
+    сами документы не меняются
+    """
+    for doc in docs:
+        model.parse_obj(doc)
+    return docs
+
+
+def transform_filmworks(rows: Iterable[dict], validate: bool = False) -> List[dict]:
+    """
+    Пачка строк PSExtract.extract_filmwork_data в документы индекса movies за один проход.
+    Роли уже разделены в SQL, поэтому остается только собрать имена
+
+    Parameters
+    ----------
+    :param rows: строки с fw_id, актерами, сценаристами, режиссерами и жанрами
+    :param validate: проверить документы схемой ESFilmworkData (отладочный режим)
+    ----------
+    """
+    with stats.timer('transform'):
+        docs = [
+            {
+                'id': str(row['fw_id']),
+                'imdb_rating': row['rating'],
+                'genre': row['genres'],
+                'title': row['title'],
+                'description': row['description'],
+                'director': row['directors'],
+                'actors_names': [person['name'] for person in row['actors']],
+                'writers_names': [person['name'] for person in row['writers']],
+                'actors': row['actors'],
+                'writers': row['writers'],
+            }
+            for row in rows
+        ]
+        if validate:
+            validate_documents(docs, ESFilmworkData)
+    stats.count('transform', 'docs', len(docs))
+    return docs
+
+
+def transform_filmwork_documents(rows: Iterable[dict], validate: bool = False) -> List[RawDocument]:
+    """
+    Строки PSExtract.extract_filmwork_documents: документ уже собран в Postgres,
+    JSON разбирается только в отладочном режиме проверки схемой
+    """
+    with stats.timer('transform'):
+        docs = [RawDocument(row['id'], row['source']) for row in rows]
+        if validate:
+            validate_documents([json.loads(doc.source) for doc in docs], ESFilmworkData)
+    stats.count('transform', 'docs', len(docs))
+    return docs
+
+
+def transform_persons(rows: Iterable[dict], validate: bool = False) -> List[dict]:
+    with stats.timer('transform'):
+        docs = [{'id': str(row['id']), 'name': row['name']} for row in rows]
+        if validate:
+            validate_documents(docs, ESPersonData)
+    stats.count('transform', 'docs', len(docs))
+    return docs
+
+
+def transform_genres(rows: Iterable[dict], validate: bool = False) -> List[dict]:
+    with stats.timer('transform'):
+        docs = [{'id': str(row['id']), 'genre': row['genre'], 'description': row['description']} for row in rows]
+        if validate:
+            validate_documents(docs, ESGenreData)
+    stats.count('transform', 'docs', len(docs))
+    return docs